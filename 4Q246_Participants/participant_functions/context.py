@@ -0,0 +1,127 @@
+'''
+The Corpus class holds the Text-Fabric classes (F, L, E)
+that the participant functions work on, together with
+memo tables that stay warm between calls. Every function
+takes an optional corpus argument; without one, the
+default corpus is used, which is the one set with
+use_corpus, or else built from the F, L, E globals of
+__main__, as made by api.makeAvailableIn(globals()).
+map_partitions runs a function over partitions of nodes
+in worker processes, each with its own corpus.
+'''
+
+import importlib.util
+import os
+import sys
+import __main__
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+
+def load_tools(name):
+    '''
+    Return the repo's tools/<name>.py as the module
+    tools_<name>, loaded by path on first use.
+    '''
+    module_name = 'tools_' + name
+    module = sys.modules.get(module_name)
+    if module is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            os.pardir, os.pardir, 'tools', name + '.py')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return module
+
+FeatureColumns = load_tools('features').FeatureColumns
+
+class Corpus:
+    '''
+    One corpus: its TF api, its memo tables, and its
+    feature columns, which hold a feature's values of
+    all nodes as an array, loaded on first use.
+    Requires a TF api, or any object with F, L, E.
+    '''
+
+    def __init__(self, api):
+        self.api = api
+        self.F = api.F
+        self.L = api.L
+        self.E = api.E
+        self.memo = {}
+        self.columns = FeatureColumns(api)
+
+    @classmethod
+    def from_main(cls):
+        '''
+        Build a corpus from the TF globals of __main__.
+        '''
+        try:
+            return cls(SimpleNamespace(F=__main__.F, L=__main__.L, E=__main__.E))
+        except AttributeError:
+            raise Exception('No corpus given and no Text-Fabric F, L, E '
+                            'in __main__; run api.makeAvailableIn(globals()) '
+                            'or participant_functions.context.use_corpus(api).')
+
+    def table(self, name):
+        '''
+        Return a named memo dict of this corpus.
+        '''
+        return self.memo.setdefault(name, {})
+
+    def cached(self, name, build):
+        '''
+        Return a named memo object, made by build(self) on first use.
+        '''
+        if name not in self.memo:
+            self.memo[name] = build(self)
+        return self.memo[name]
+
+_default = None
+
+def use_corpus(corpus):
+    '''
+    Set the default corpus, given a Corpus or a TF api.
+    Returns the Corpus.
+    '''
+    global _default
+    _default = corpus if isinstance(corpus, Corpus) else Corpus(corpus)
+    return _default
+
+def get_corpus(corpus=None):
+    '''
+    Return corpus, or the default corpus if None.
+    '''
+    if corpus is not None:
+        return corpus
+    if _default is None:
+        use_corpus(Corpus.from_main())
+    return _default
+
+def _init_worker(load):
+    if load is not None:
+        use_corpus(load())
+
+def partition(nodes, partitions):
+    '''
+    Split nodes into partitions contiguous slices.
+    '''
+    nodes = list(nodes)
+    size = -(-len(nodes) // max(partitions, 1)) or 1
+    return [nodes[i:i+size] for i in range(0, len(nodes), size)]
+
+def map_partitions(function, nodes, load=None, processes=None, partitions=None):
+    '''
+    Run function(partition) over partitions of nodes
+    in worker processes; return the results in order.
+    Functions run on each worker's default corpus, which
+    load() returns, a TF api or Corpus; load must be
+    picklable, e.g. a module-level function.
+    Without load, workers inherit the parent's default
+    corpus, which requires the fork start method.
+    '''
+    processes = processes or os.cpu_count()
+    chunks = partition(nodes, partitions or 4 * processes)
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(load,)) as pool:
+        return list(pool.map(function, chunks))
@@ -1,12 +1,15 @@
-from __main__ import * # this module assumes the Text-Fabric methods have been globalized
+import time
+from .context import get_corpus
 
-def get_nomen_recta(regens):
+def get_nomen_recta(regens, corpus=None):
     '''
     Return a list of the nomen rectums of a given nomen regens.
     The list contains nomen rectum subphrases 
     with the regens as their head.
     Require a word node that is the mother of a nom. rectum subphrase.
     '''
+    corpus = get_corpus(corpus)
+    F, L, E = corpus.F, corpus.L, corpus.E
     
     # put nom. rectums here
     nom_rectums = []
@@ -68,3 +71,81 @@ def get_nomen_recta(regens):
         nom_rectums.extend(all_rectums) 
 
     return nom_rectums
+
+
+class NomenRectaIndex:
+    '''
+    Maps every nomen regens in the corpus to its
+    nomen rectum subphrases, as get_nomen_recta returns them.
+    Built once by walking the subphrases and their
+    mother edges, after which lookups are dict reads.
+    The build is summarized in self.report.
+    '''
+
+    def __init__(self, corpus=None):
+        start = time.time()
+        self.corpus = corpus = get_corpus(corpus)
+        F, L, E = corpus.F, corpus.L, corpus.E
+        subphrases = F.otype.s('subphrase')
+        rela = {sp: F.rela.v(sp) for sp in subphrases}
+
+        # words in a 'rec' subphrase, and the 'NA' subphrases
+        # of each word in the order L.u gives them
+        in_rectum = set()
+        na_subphrases = {}
+        for sp in subphrases:
+            words = L.d(sp, otype='word')
+            if rela[sp] == 'rec':
+                in_rectum.update(words)
+            elif rela[sp] == 'NA':
+                for w in words:
+                    na_subphrases.setdefault(w, []).append(sp)
+
+        # every mother of a 'rec' subphrase is a regens
+        regentes = sorted(set(regens for sp in subphrases if rela[sp] == 'rec'
+                                  for regens in E.mother.f(sp)))
+
+        self.recta = {}
+        for regens in regentes:
+            rectum = [rec for rec in E.mother.t(regens)
+                          if F.rela.v(rec) == 'rec'][0]
+            rectum_in_series = na_subphrases.get(L.d(rectum, otype='word')[0])
+            if not rectum_in_series:
+                self.recta[regens] = [rectum]
+                continue
+            all_rectums = [rectum_in_series[0]]
+            for rectum in rectum_in_series:
+                all_rectums.extend(sp for sp in E.mother.t(rectum)
+                                       if F.rela.v(sp) == 'par'
+                                       and L.d(sp, otype='word')[0] in in_rectum)
+            self.recta[regens] = all_rectums
+
+        lengths = [len(recta) for recta in self.recta.values()]
+        self.report = {'regentes': len(self.recta),
+                       'series': sum(1 for l in lengths if l > 1),
+                       'longest': max(lengths, default=0),
+                       'seconds': round(time.time() - start, 2)}
+
+    def __contains__(self, regens):
+        return regens in self.recta
+
+    def __getitem__(self, regens):
+        return self.recta[regens]
+
+    def get(self, regens, default=None):
+        return self.recta.get(regens, default)
+
+    def check(self, regentes=None):
+        '''
+        Return the regentes for which the index differs
+        from get_nomen_recta, checking all by default.
+        '''
+        regentes = self.recta if regentes is None else regentes
+        return [regens for regens in regentes
+                    if self.get(regens) != get_nomen_recta(regens, self.corpus)]
+
+def nomen_recta_index(corpus=None):
+    '''
+    Return the corpus's NomenRectaIndex, building it on first use.
+    '''
+    return get_corpus(corpus).cached('nomen_recta_index', NomenRectaIndex)
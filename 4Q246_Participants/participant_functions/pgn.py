@@ -1,10 +1,13 @@
-from __main__ import * # this module assumes the Text-Fabric methods have been globalized
+import numpy as np
+from .context import get_corpus
 
-def get_pgn(word, pronom=False):
+def get_pgn(word, pronom=False, corpus=None):
     '''
     Return a person, gender, number (PGN) tuple 
     for a word or pronominal suffix.
     '''
+    F = get_corpus(corpus).F
+    
     # return word PGN tuple
     if not pronom:
         return (F.ps.v(word), F.gn.v(word), F.nu.v(word))
@@ -36,4 +39,93 @@ def match_pgn(main_pgn, cmp_pgn):
         return True
     
     else:
-        return False
\ No newline at end of file
+        return False
+
+
+# PGN values -> small integer codes, shared by all encodings
+# so that codes can be compared across arrays; 'unknown' is 0
+pgn_codes = {'unknown': 0}
+
+def encode_values(values):
+    '''
+    Return an int16 array of codes for PGN values.
+    '''
+    return np.fromiter((pgn_codes.setdefault(v, len(pgn_codes)) for v in values),
+                       dtype=np.int16)
+
+def encode_pgn(pgns):
+    '''
+    Encode PGN tuples as (p3, gn, nu) arrays for match_pgn_matrix.
+    p3 is True where the person may be third person
+    (p3, unknown, or NA); gn and nu are value codes.
+    '''
+    pgns = list(pgns)
+    ps, gn, nu = zip(*pgns) if pgns else ((), (), ())
+    p3 = np.isin(encode_values(ps), encode_values(['p3', 'unknown', 'NA']))
+    return (p3, encode_values(gn), encode_values(nu))
+
+def encode_column(column, nodes):
+    '''
+    Return the PGN value codes of nodes in a feature
+    column of string values, encoding each distinct
+    value once.
+    '''
+    # code -1 (no value) reads the trailing None
+    return encode_values(column.values + [None])[column.codes(nodes)]
+
+def pgn_table(pronom=False, corpus=None):
+    '''
+    Return the encoded PGN of every word in the corpus
+    as (p3, gn, nu) arrays indexed by node, or of every
+    pronominal suffix if pronom. Built once per corpus
+    from its feature columns.
+    Nodes that are not words are never p3.
+    '''
+    def build(corpus):
+        F = corpus.F
+        size = F.otype.maxNode + 1
+        words = np.fromiter(F.otype.s('word'), dtype=np.int64)
+        names = ('prs_ps', 'prs_gn', 'prs_nu') if pronom else ('ps', 'gn', 'nu')
+        ps, gn, nu = (encode_column(corpus.columns.Fs(name), words) for name in names)
+        p3 = np.isin(ps, encode_values(['p3', 'unknown', 'NA']))
+        table = (np.zeros(size, dtype=bool),
+                 np.full(size, encode_values([None])[0], dtype=np.int16),
+                 np.full(size, encode_values([None])[0], dtype=np.int16))
+        for column, values in zip(table, (p3, gn, nu)):
+            column[words] = values
+        return table
+    name = 'prs_pgn_table' if pronom else 'pgn_table'
+    return get_corpus(corpus).cached(name, build)
+
+def get_pgns(words, pronom=False, corpus=None):
+    '''
+    Return the encoded PGN (p3, gn, nu) arrays of words,
+    or of their pronominal suffixes if pronom.
+    '''
+    words = np.fromiter(words, dtype=np.int64)
+    return tuple(column[words] for column in pgn_table(pronom, corpus))
+
+def match_pgn_matrix(main_pgns, cmp_pgns):
+    '''
+    Return a boolean matrix of match_pgn for every pair
+    of main (rows) and compared (columns) PGNs.
+    Requires two encoded (p3, gn, nu) triples,
+    as given by encode_pgn or get_pgns.
+    '''
+    main_p3, main_gn, main_nu = (np.asarray(a)[:, None] for a in main_pgns)
+    cmp_p3, cmp_gn, cmp_nu = (np.asarray(a)[None, :] for a in cmp_pgns)
+    unknown = pgn_codes['unknown']
+
+    return (main_p3 & cmp_p3
+            & (main_nu == cmp_nu)
+            & ((main_gn == cmp_gn) | (main_gn == unknown) | (cmp_gn == unknown)))
+
+def agreement_matrix(main_words, cmp_words, main_pronom=True, cmp_pronom=False, corpus=None):
+    '''
+    Return a boolean matrix of PGN agreement between main_words
+    (rows) and cmp_words (columns), by default between the
+    pronominal suffixes of main_words and cmp_words themselves,
+    e.g. suffixes against candidate verbs and nouns.
+    '''
+    return match_pgn_matrix(get_pgns(main_words, main_pronom, corpus),
+                            get_pgns(cmp_words, cmp_pronom, corpus))
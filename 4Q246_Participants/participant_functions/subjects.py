@@ -1,48 +1,81 @@
-from __main__ import * # this module assumes the Text-Fabric methods have been globalized
+import numpy as np
+from .context import get_corpus
 
-def is_preposition_subj(word):
+# keep words with these part of speech tags
+keep_pdp = {'subs', # noun
+            'nmpr', # proper noun
+            'prps', # personal pronoun
+            'prde', # demonstrative pronoun
+            'prin'} # interrogative pronoun
+
+# keep words in phrase_atoms with these type features
+keep_pa_typ = {'NP',   # noun phrase
+               'PrNP', # proper noun phrase
+               'PPrP', # personal pronoun phr.
+               'DPrP', # demonstrative pron. phr.
+               'IPrP'} # interrogative pron. phr.
+
+# exclude words in phrase_atoms with these relation features
+omit_pa_rela = {'Appo', # apposition
+                'Spec'} # specification
+
+# exclude words in subphrases with these relation features
+omit_sp_rela = {'rec', # nomens rectum
+                'adj', # adjectival
+                'atr', # attributive
+                'mod', # modifier
+                'dem'} # demontrative
+
+def is_preposition_phrase(w_phrase, corpus=None):
     '''
-    Return boolean on whether a word is a preposition subject,
-    necessary for cases in which the subject is marked in
-    a prepositional phrase, such as in passive clauses.
-    Require a word node.
-    
-    *Caution*
-    Does not capture cases such as Gen 21:5 (ca# 516487)
+    Return boolean on whether a phrase is a subject
+    marked in a prepositional phrase.
+    Require a phrase node.
     '''
-    # get word phrase
-    w_phrase = L.u(word, otype='phrase')[0]
-    
-    # return false if wordnode not in a subject phrase
+    corpus = get_corpus(corpus)
+    F, L = corpus.F, corpus.L
+
+    # return false if not a subject phrase
     if F.function.v(w_phrase) != 'Subj':
         return False
-    
-    # get all phrase atoms in the phrase    
+
+    # get all phrase atoms in the phrase
     # exclude negations and conjunctions
     phrase_atoms = [phrs_at for phrs_at in L.d(w_phrase, otype='phrase_atom')
                         if F.typ.v(phrs_at) not in {'NegP','CP'}
                    ]
-    
+
     # check whether the only phrase atom in the phrase is a prep. phrase
-    if len(phrase_atoms) == 1 and F.typ.v(phrase_atoms[0]) == 'PP':
-        
-        # is a prepositional subject
-        return True
+    return len(phrase_atoms) == 1 and F.typ.v(phrase_atoms[0]) == 'PP'
 
-    else:
-        # is not a prep subj
-        return False
-    
-    
-def validate_subject(word):
+def is_preposition_subj(word, w_phrase=None, corpus=None):
+    '''
+    Return boolean on whether a word is a preposition subject,
+    necessary for cases in which the subject is marked in
+    a prepositional phrase, such as in passive clauses.
+    Require a word node. The word's phrase can be supplied
+    if it is already known.
+
+    *Caution*
+    Does not capture cases such as Gen 21:5 (ca# 516487)
+    '''
+    corpus = get_corpus(corpus)
+
+    # get word phrase
+    if w_phrase is None:
+        w_phrase = corpus.L.u(word, otype='phrase')[0]
+
+    return is_preposition_phrase(w_phrase, corpus)
+
+
+def validate_subject(word, corpus=None):
     '''
     Return boolean on whether a word is a subject or not,
     i.e. a word without any modifiers that functions as subj.
     Require word node.
     
     Based on a supplied wordnode get phrase, phrase atom, and subphrase,
-    features and compare them against a group of sets.
-    Define those sets first. Then make the comparison.
+    features and compare them against the keep/omit sets above.
     
     *Caution* 
     This function works reasonably well,
@@ -51,32 +84,9 @@ def validate_subject(word):
     See Gen 20:5 for a good edge case example, in which both היא pronouns
     are registered as subjects, but only one should be.
     '''
+    corpus = get_corpus(corpus)
+    F, L = corpus.F, corpus.L
     
-    # keep words with these part of speech tags
-    keep_pdp = {'subs', # noun
-                'nmpr', # proper noun
-                'prps', # personal pronoun
-                'prde', # demonstrative pronoun
-                'prin'} # interrogative pronoun
-                   
-    # keep words in phrase_atoms with these type features
-    keep_pa_typ = {'NP',   # noun phrase
-                   'PrNP', # proper noun phrase
-                   'PPrP', # personal pronoun phr.
-                   'DPrP', # demonstrative pron. phr.
-                   'IPrP'} # interrogative pron. phr.
-    
-    # exclude words in phrase_atoms with these relation features
-    omit_pa_rela = {'Appo', # apposition
-                    'Spec'} # specification
-    
-    # exclude words in subphrases with these relation features
-    omit_sp_rela = {'rec', # nomens rectum
-                    'adj', # adjectival 
-                    'atr', # attributive
-                    'mod', # modifier
-                    'dem'} # demontrative
-                        
     # get word's phrase, phrase atom, and subphrase, and subphrase relations
     w_phrase = L.u(word, otype='phrase')[0] # word's phrase node
     w_phrase_atom = L.u(word, otype='phrase_atom')[0] # word's phrase atom
@@ -94,7 +104,7 @@ def validate_subject(word):
             # either the word is in good phrase atom type 
             # or is part of a prepositional subj, e.g. with passives
             F.typ.v(w_phrase_atom) in keep_pa_typ\
-                or is_preposition_subj(word),
+                or is_preposition_subj(word, w_phrase, corpus),
             
             # phrase_atom relation is valid
             F.rela.v(w_phrase_atom) not in omit_pa_rela,
@@ -108,4 +118,98 @@ def validate_subject(word):
     
     else:
         # word is not subject
-        return False
\ No newline at end of file
+        return False
+
+
+class SubjectIndex:
+    '''
+    Precomputed subject criteria for all words,
+    for validating many words at once.
+    Phrases, phrase atoms, and subphrases are walked
+    down once each to find every word's ancestry,
+    and their criteria are stored as boolean arrays
+    indexed by node, read from the corpus's feature
+    columns. Words without a phrase or phrase atom
+    are never subjects.
+    '''
+
+    def __init__(self, corpus=None):
+        corpus = get_corpus(corpus)
+        F, L = corpus.F, corpus.L
+        size = F.otype.maxNode + 1
+
+        # word -> first phrase / phrase atom, 0 if none
+        self.phrase = np.zeros(size, dtype=np.int64)
+        self.phrase_atom = np.zeros(size, dtype=np.int64)
+        for otype, ancestry in (('phrase', self.phrase),
+                                ('phrase_atom', self.phrase_atom)):
+            for node in F.otype.s(otype):
+                words = np.array(L.d(node, otype='word'), dtype=np.int64)
+                words = words[ancestry[words] == 0]
+                ancestry[words] = node
+
+        # container criteria, node 0 fails all of them;
+        # feature values are read from the corpus's columns
+        columns = corpus.columns
+        phrases = np.fromiter(F.otype.s('phrase'), dtype=np.int64)
+        phrase_atoms = np.fromiter(F.otype.s('phrase_atom'), dtype=np.int64)
+        self.subj_phrase = np.zeros(size, dtype=bool)
+        self.subj_phrase[phrases] = columns.function.eq(phrases, 'Subj')
+        self.prep_phrase = np.zeros(size, dtype=bool)
+        for phrase in phrases[self.subj_phrase[phrases]]:
+            self.prep_phrase[phrase] = is_preposition_phrase(int(phrase), corpus)
+        self.good_pa_typ = np.zeros(size, dtype=bool)
+        self.good_pa_typ[phrase_atoms] = columns.typ.isin(phrase_atoms, keep_pa_typ)
+        self.good_pa_rela = np.zeros(size, dtype=bool)
+        self.good_pa_rela[phrase_atoms] = ~columns.rela.isin(phrase_atoms, omit_pa_rela)
+
+        # word criteria
+        words = np.fromiter(F.otype.s('word'), dtype=np.int64)
+        self.good_pdp = np.zeros(size, dtype=bool)
+        self.good_pdp[words] = columns.pdp.isin(words, keep_pdp)
+        self.omit_sp = np.zeros(size, dtype=bool)
+        subphrases = np.fromiter(F.otype.s('subphrase'), dtype=np.int64)
+        for sp in subphrases[columns.rela.isin(subphrases, omit_sp_rela)]:
+            self.omit_sp[list(L.d(int(sp), otype='word'))] = True
+
+    def is_preposition_subj(self, words):
+        '''
+        Return a boolean array, is_preposition_subj for every word.
+        '''
+        words = np.asarray(words, dtype=np.int64)
+        return self.prep_phrase[self.phrase[words]]
+
+    def validate(self, words):
+        '''
+        Return a boolean array, validate_subject for every word.
+        '''
+        words = np.asarray(words, dtype=np.int64)
+        phrase = self.phrase[words]
+        phrase_atom = self.phrase_atom[words]
+        return (self.subj_phrase[phrase]
+                & self.good_pdp[words]
+                & (self.good_pa_typ[phrase_atom] | self.prep_phrase[phrase])
+                & self.good_pa_rela[phrase_atom]
+                & ~self.omit_sp[words])
+
+def subject_index(corpus=None):
+    '''
+    Return the corpus's SubjectIndex, building it on first use.
+    '''
+    return get_corpus(corpus).cached('subject_index', SubjectIndex)
+
+def validate_subjects(words, corpus=None):
+    '''
+    Return a boolean array on whether each word is a subject,
+    with the same results as validate_subject.
+    Require an iterable of word nodes.
+    '''
+    return subject_index(corpus).validate(np.fromiter(words, dtype=np.int64))
+
+def are_preposition_subjs(words, corpus=None):
+    '''
+    Return a boolean array on whether each word is a
+    preposition subject, as is_preposition_subj.
+    Require an iterable of word nodes.
+    '''
+    return subject_index(corpus).is_preposition_subj(np.fromiter(words, dtype=np.int64))
@@ -0,0 +1,162 @@
+'''
+The FeatureColumn class loads a Text-Fabric feature once
+into a dense NumPy array indexed by node, so that values
+of many nodes are read, compared, and grouped as array ops.
+String values are dictionary-encoded to integer codes.
+The FeatureColumns class loads columns on demand, like F.
+Columns take a TF app, a TF api, or any object with F.
+This module is shared by word_vectors and 4Q246_Participants,
+which add tools to sys.path to import it.
+'''
+
+import numpy as np
+
+class FeatureColumn:
+    '''
+    A feature as a dense array over all nodes.
+    Integer features are stored as their values with a
+    presence mask; other features as int32 codes into
+    the values list, with -1 where a node has no value.
+    .v works on a single node like Fs(name).v, or
+    on an array of nodes, returning an array.
+    '''
+
+    def __init__(self, tf, name):
+        api = getattr(tf, 'api', tf)
+        self.name = name
+        size = api.F.otype.maxNode + 1
+        items = list(getattr(api.F, name).items())
+        nodes = np.fromiter((n for n, v in items), dtype=np.int64, count=len(items))
+        self.present = np.zeros(size, dtype=bool)
+        self.present[nodes] = True
+        self.is_int = all(type(v) == int for n, v in items) and bool(items)
+
+        if self.is_int:
+            self.values = None
+            self.data = np.zeros(size, dtype=np.int64)
+            self.data[nodes] = [v for n, v in items]
+        else:
+            self.values = []
+            self.ids = {}
+            codes = np.empty(len(items), dtype=np.int32)
+            for i, (n, v) in enumerate(items):
+                code = self.ids.get(v)
+                if code is None:
+                    code = self.ids[v] = len(self.values)
+                    self.values.append(v)
+                codes[i] = code
+            self.data = np.full(size, -1, dtype=np.int32)
+            self.data[nodes] = codes
+            # code -1 reads the trailing None
+            self._decode = np.array(self.values + [None], dtype=object)
+
+    def __len__(self):
+        return int(self.present.sum())
+
+    def v(self, nodes):
+        '''
+        Return the value(s) of node(s), None where absent.
+        Arrays of integer features give 0 where absent,
+        use .has to tell those apart.
+        '''
+        if np.ndim(nodes) == 0:
+            n = int(nodes)
+            if not 0 <= n < self.data.size or not self.present[n]:
+                return None
+            return (int(self.data[n]) if self.is_int
+                        else self.values[self.data[n]])
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return (self.data[nodes] if self.is_int
+                    else self._decode[self.data[nodes]])
+
+    def has(self, nodes):
+        '''
+        Return whether node(s) have a value.
+        '''
+        return self.present[nodes]
+
+    def codes(self, nodes):
+        '''
+        Return the integer codes of nodes, -1 where absent.
+        Integer features give their values.
+        '''
+        return self.data[nodes]
+
+    def code(self, value):
+        '''
+        Return the code of a value, -1 if not used.
+        '''
+        if self.is_int:
+            return value
+        return self.ids.get(value, -1)
+
+    def isin(self, nodes, values):
+        '''
+        Return a boolean mask of nodes with one of values.
+        '''
+        if type(values) == str or not hasattr(values, '__iter__'):
+            values = [values]
+        if self.is_int:
+            return self.present[nodes] & np.isin(self.data[nodes], list(values))
+        codes = [self.ids[v] for v in values if v in self.ids]
+        return np.isin(self.data[nodes], codes)
+
+    def eq(self, nodes, value):
+        '''
+        Return a boolean mask of nodes with the value.
+        '''
+        return self.isin(nodes, [value])
+
+    def nodes(self, value):
+        '''
+        Return all nodes with the value, in node order.
+        '''
+        if self.is_int:
+            return np.flatnonzero(self.present & (self.data == value))
+        code = self.ids.get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.data == code)
+
+    def nbytes(self):
+        return self.data.nbytes + self.present.nbytes
+
+class FeatureColumns:
+    '''
+    Feature columns of a corpus, loaded on first use.
+    Columns are accessed like F: columns.lex.v(nodes),
+    or like Fs: columns.Fs('lex').v(nodes).
+    Use FeatureColumns.cached to share columns.
+    '''
+
+    _cache = {}
+
+    def __init__(self, tf):
+        self.tf = tf
+        self._columns = {}
+
+    @classmethod
+    def cached(cls, tf):
+        '''
+        Return shared columns for a corpus.
+        '''
+        key = id(getattr(tf, 'api', tf))
+        if key not in cls._cache:
+            cls._cache[key] = cls(tf)
+        return cls._cache[key]
+
+    def Fs(self, name):
+        if name not in self._columns:
+            self._columns[name] = FeatureColumn(self.tf, name)
+        return self._columns[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.Fs(name)
+
+    def loaded(self):
+        '''
+        Return {feature: bytes used} of loaded columns.
+        '''
+        return {name: col.nbytes() for name, col in self._columns.items()}
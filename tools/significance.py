@@ -3,9 +3,14 @@ This module contains scripts for testing statistical associations.
 '''
 
 import collections
+import contextlib
+import time
 import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import scipy.sparse as sp
 import scipy.stats as stats
+from scipy.special import gammaln
 
 def normalize_axes(df, sample_axis, feature_axis):
     """Tests and transposes DataFrame to sample * feature format.
@@ -29,6 +34,285 @@ def normalize_axes(df, sample_axis, feature_axis):
         raise Exception('Invalid axis! Should be 0 or 1')
     return df
 
+def derive_contingencies(a, samp_margins, feat_margins, total):
+    """Derive (a, b, c, d, e) from A and broadcastable margins.
+
+    See contingency_table for the math. The margins only need
+    to broadcast against A, e.g. a column vector of sample margins 
+    and a row vector of feature margins for a 2-D block of A.
+    """
+    b = samp_margins - a
+    c = feat_margins - a
+    d = total - samp_margins - feat_margins + a
+    e = samp_margins * feat_margins / total
+    return (a, b, c, d, e)
+
+class ContingencyTable:
+    """Array-backed 2x2 contingency data for a co-occurrence matrix.
+
+    Holds the observed frequencies (A) of a samples*features 
+    matrix together with its sample margins, feature margins, 
+    and total as 1-D vectors / a scalar. B, C, D, and E are 
+    not stored but derived from the margins by broadcasting 
+    when asked for, either for the whole table or for a block
+    of sample rows at a time. This avoids building the full-size 
+    margin tables and copies that the DataFrame approach needs.
+    See contingency_table for the definitions of A-E.
+
+    A may also be a scipy.sparse matrix. It is then kept in 
+    CSR format; blocks are densified only for the selected rows,
+    and cells / zero_patterns give access to the stored cells 
+    and the zero cells without densifying at all.
+
+    Use from_frame or from_sparse to build one in either orientation.
+    """
+
+    def __init__(self, a, index=None, columns=None):
+        if sp.issparse(a):
+            self.a = sp.csr_matrix(a)
+            self.a.sum_duplicates()
+            self.a.eliminate_zeros()
+        else:
+            self.a = np.asarray(a)
+        self.index = index
+        self.columns = columns
+        self.samp_margins = np.asarray(self.a.sum(axis=1)).ravel()
+        self.feat_margins = np.asarray(self.a.sum(axis=0)).ravel()
+        self.total = self.samp_margins.sum()
+
+    @classmethod
+    def from_frame(cls, df, sample_axis, feature_axis):
+        """Build table from a DataFrame; samples are put in rows."""
+        df = normalize_axes(df, sample_axis, feature_axis)
+        return cls(df.values, index=df.index, columns=df.columns)
+
+    @classmethod
+    def from_sparse(cls, matrix, sample_axis, feature_axis, 
+                    index=None, columns=None):
+        """Build table from a sparse matrix; samples are put in rows.
+
+        Arguments:
+            matrix: scipy.sparse matrix (CSR, CSC, COO, ...)
+            sample_axis, feature_axis: as in normalize_axes
+            index: labels of the matrix's rows, as passed in
+            columns: labels of the matrix's columns, as passed in
+        """
+        if sample_axis == 1 and feature_axis == 0:
+            matrix, index, columns = matrix.T, columns, index
+        elif sample_axis != 0 and feature_axis != 1:
+            raise Exception('Invalid axis! Should be 0 or 1')
+        return cls(matrix, index=index, columns=columns)
+
+    @property
+    def shape(self):
+        return self.a.shape
+
+    @property
+    def is_sparse(self):
+        return sp.issparse(self.a)
+
+    def _dense(self, rows=slice(None)):
+        a = self.a[rows]
+        return a.toarray() if sp.issparse(a) else a
+
+    @property
+    def b(self):
+        return self.samp_margins[:, None] - self._dense()
+
+    @property
+    def c(self):
+        return self.feat_margins[None, :] - self._dense()
+
+    @property
+    def d(self):
+        # D = total - (A+B+C) = total - samp_margin - feat_margin + A
+        return (self.total - self.samp_margins[:, None] 
+                    - self.feat_margins[None, :] + self._dense())
+
+    @property
+    def e(self):
+        return np.outer(self.samp_margins, self.feat_margins) / self.total
+
+    def block(self, rows=slice(None)):
+        """Return (a, b, c, d, e) arrays for a selection of sample rows.
+
+        Arguments:
+            rows: slice, index array, or boolean mask over samples
+
+        Returns:
+            5-tuple of arrays shaped (selected samples, features)
+        """
+        return derive_contingencies(self._dense(rows), 
+                                    self.samp_margins[rows][:, None],
+                                    self.feat_margins[None, :], self.total)
+
+    def blocks(self, size):
+        """Iterate over (rows, (a, b, c, d, e)) blocks of sample rows.
+
+        Only one block of derived values is alive at a time,
+        so peak memory is bounded by the block size.
+
+        Arguments:
+            size: number of sample rows per block
+        """
+        for start in range(0, self.shape[0], size):
+            rows = slice(start, min(start + size, self.shape[0]))
+            yield rows, self.block(rows)
+
+    def frames(self):
+        """Return the full (a, b, c, d, e) tables as DataFrames."""
+        return tuple(pd.DataFrame(table, index=self.index, columns=self.columns,
+                                  copy=False)
+                         for table in self.block())
+
+    def cells(self):
+        """Return contingency data of the non-zero cells only.
+
+        Returns:
+            2-tuple of ((rows, cols), (a, b, c, d, e)), all 1-D arrays
+            in row-major order of the non-zero cells
+        """
+        if self.is_sparse:
+            rows = np.repeat(np.arange(self.shape[0]), np.diff(self.a.indptr))
+            cols, a = self.a.indices, self.a.data
+        else:
+            rows, cols = np.nonzero(self.a)
+            a = self.a[rows, cols]
+        return (rows, cols), derive_contingencies(a, self.samp_margins[rows],
+                                                  self.feat_margins[cols], self.total)
+
+    def zero_patterns(self):
+        """Return contingency data shared by the zero cells.
+
+        A cell where A == 0 has B == sample margin, C == feature 
+        margin and D == total - B - C. So zero cells only differ 
+        in their margins, and there are far fewer distinct margin 
+        values than samples or features. The data is given once 
+        for each distinct (sample margin, feature margin) pair.
+
+        Returns:
+            3-tuple of (samp_codes, feat_codes, (a, b, c, d, e)), where
+            the 5 arrays are grids shaped (distinct sample margins, 
+            distinct feature margins) and the codes map every 
+            sample / feature to its row / column in those grids
+        """
+        samp_values, samp_codes = np.unique(self.samp_margins, return_inverse=True)
+        feat_values, feat_codes = np.unique(self.feat_margins, return_inverse=True)
+        a = np.zeros((samp_values.size, feat_values.size), dtype=samp_values.dtype)
+        return samp_codes, feat_codes, derive_contingencies(a, samp_values[:, None],
+                                                            feat_values[None, :],
+                                                            self.total)
+
+def _label(labels, ids):
+    """Map integer positions to labels, if there are labels."""
+    return ids if labels is None else np.asarray(labels)[ids]
+
+def _rank_by_row(rows, scores):
+    """Order cells by row, then by descending score.
+
+    Returns:
+        2-tuple of (order, rank): the indices that sort the cells,
+        and each sorted cell's 0-based rank within its row
+    """
+    order = np.lexsort((-scores, rows))
+    rows = rows[order]
+    first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    rank = np.arange(rows.size) - np.repeat(first, np.diff(np.r_[first, rows.size]))
+    return order, rank
+
+class SparseScores:
+    """Association scores over a sparse co-occurrence matrix.
+
+    Scores of the stored (non-zero) cells are kept in a CSR 
+    matrix with the same sparsity pattern as the counts. 
+    All zero cells with the same sample and feature margins 
+    share a score, so zero cells are kept as a small grid over 
+    distinct margins plus a code per sample and per feature 
+    (see ContingencyTable.zero_patterns).
+    Scores are oriented as samples*features.
+    """
+
+    def __init__(self, observed, zero_grid, samp_codes, feat_codes,
+                 index=None, columns=None):
+        self.observed = observed
+        self.zero_grid = zero_grid
+        self.samp_codes = samp_codes
+        self.feat_codes = feat_codes
+        self.index = index
+        self.columns = columns
+
+    @property
+    def shape(self):
+        return self.observed.shape
+
+    def zero_scores(self, rows, cols):
+        """Score that zero cells at the given samples/features would get."""
+        return self.zero_grid[self.samp_codes[rows], self.feat_codes[cols]]
+
+    def toarray(self):
+        """Return all scores as a dense samples*features array."""
+        dense = self.zero_grid[np.ix_(self.samp_codes, self.feat_codes)]
+        coo = self.observed.tocoo()
+        dense[coo.row, coo.col] = coo.data
+        return dense
+
+    def to_frame(self):
+        """Return all scores as a dense DataFrame."""
+        return pd.DataFrame(self.toarray(), index=self.index, columns=self.columns)
+
+    def topk(self, k):
+        """Return the k highest-scoring non-zero cells per sample.
+
+        Zero cells are left out: they have A < E and so 
+        are never attractions.
+
+        Returns:
+            DataFrame with columns sample, feature, score, rank;
+            sorted by sample and descending score
+        """
+        observed = self.observed
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(observed.indptr))
+        order, rank = _rank_by_row(rows, observed.data)
+        keep = rank < k
+        order, rank = order[keep], rank[keep]
+        return pd.DataFrame({
+            'sample': _label(self.index, rows[order]),
+            'feature': _label(self.columns, observed.indices[order]),
+            'score': observed.data[order],
+            'rank': rank,
+        })
+
+def score_sparse(table, measure):
+    """Apply an association measure to a sparse ContingencyTable.
+
+    The measure is run over the non-zero cells and once over
+    the distinct margin patterns of the zero cells, so the cost
+    scales with the number of non-zero cells, not with 
+    samples*features.
+
+    Arguments:
+        table: ContingencyTable, normally built with from_sparse
+        measure: function taking arrays (a, b, c, d, e) and 
+            returning an array of scores of the same shape,
+            or a tuple of such arrays
+
+    Returns:
+        SparseScores, or a tuple of them if measure returns a tuple
+    """
+    _, cells = table.cells()
+    samp_codes, feat_codes, zeros = table.zero_patterns()
+    a = table.a if table.is_sparse else sp.csr_matrix(table.a)
+    cell_scores, zero_scores = measure(*cells), measure(*zeros)
+
+    def package(cell_score, zero_score):
+        observed = sp.csr_matrix((cell_score, a.indices, a.indptr), shape=a.shape)
+        return SparseScores(observed, zero_score, samp_codes, feat_codes,
+                            index=table.index, columns=table.columns)
+
+    if isinstance(cell_scores, tuple):
+        return tuple(package(cs, zs) for cs, zs in zip(cell_scores, zero_scores))
+    return package(cell_scores, zero_scores)
+
 def contingency_table(df, sample_axis, feature_axis):
     """Build 2x2 contingency table for calculating association measures.
 
@@ -68,6 +352,9 @@ def contingency_table(df, sample_axis, feature_axis):
 
         >> E = sum(sample) * sum(feature) / sum(dataset)
 
+    The tables are derived from a ContingencyTable, which only 
+    keeps the sample and feature margins as 1-D vectors.
+
     Arguments:
         df: a dataframe with co-occurrence frequencies in shape
             of samples*features or feature*samples
@@ -80,39 +367,432 @@ def contingency_table(df, sample_axis, feature_axis):
         5-tuple of dataframes as (a, b, c, d, e)
     """    
 
-    # put data in sample * feature format for calculations
-    # will flip it back at end if needed
-    df = normalize_axes(df, sample_axis, feature_axis)
-
-    # get observation sums across samples / features
-    # fill each row in a column with the sum across the whole column
-    # and do same for columns
-    samp_margins = df.apply(
-        lambda row: row.sum(), 
-        axis=1, 
-        result_type='broadcast' # keeps same shape
-    ) 
-    feat_margins = df.apply(
-        lambda col: col.sum(), 
-        axis=0, 
-        result_type='broadcast'
-    ) 
-    total_margin = df.sum().sum()
-    b = samp_margins.sub(df) # NB "df" == a
-    c = feat_margins.sub(df)
-    # for d, make table where every cell is total margin
-    # use that table to make subtractions:
-    d = pd.DataFrame.copy(df, deep=True)
-    d[:] = total_margin 
-    d = d.sub(df+b+c)
-    e = samp_margins * feat_margins / total_margin
+    table = ContingencyTable.from_frame(df, sample_axis, feature_axis)
+    a, b, c, d, e = table.frames()
     # flip axes back if needed:
     if sample_axis == 1:
-        df,b,c,d,e = df.T, b.T, c.T, d.T, e.T
-    return (df, b, c, d, e)
+        a, b, c, d, e = a.T, b.T, c.T, d.T, e.T
+    return (a, b, c, d, e)
     
+def _log_binom(n, k):
+    """Log of the binomial coefficient n choose k, for arrays."""
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+def hypergeom_logpmf(x, total, row, col):
+    """Log-probability of cell A under the hypergeometric null.
+
+    Given the margins of a 2x2 table, the count in cell A
+    follows a hypergeometric distribution. The probability
+    is computed in log-space with gammaln so that large 
+    corpus margins do not under- or overflow. Values of x 
+    outside of the distribution's support get -inf.
+
+    Arguments:
+        x: array of A values to evaluate
+        total: array of table totals (A+B+C+D)
+        row: array of sample margins (A+B)
+        col: array of feature margins (A+C)
+
+    Returns:
+        array of log-probabilities
+    """
+    with np.errstate(invalid='ignore'):
+        logp = (_log_binom(col, x)
+                    + _log_binom(total - col, row - x)
+                    - _log_binom(total, row))
+    lower = np.maximum(0, row + col - total)
+    upper = np.minimum(row, col)
+    return np.where((x >= lower) & (x <= upper), logp, -np.inf)
+
+def _tail_boundary(inside, outside, total, row, col, threshold):
+    """Bisect the hypergeometric pmf for the opposite tail.
+
+    The pmf is unimodal, so between a point above the threshold 
+    (inside, toward the mode) and a point at or below it (outside)
+    there is exactly one crossing. All cells are bisected at once;
+    the returned array holds the outside point closest to the mode.
+    """
+    inside, outside = inside.copy(), outside.copy()
+    while True:
+        todo = np.abs(outside - inside) > 1
+        if not todo.any():
+            return outside
+        mid = np.floor((inside + outside) / 2)
+        below = hypergeom_logpmf(mid, total, row, col) <= threshold
+        outside = np.where(todo & below, mid, outside)
+        inside = np.where(todo & ~below, mid, inside)
+
+def _log_tail(start, step, total, row, col, where):
+    """Log of the hypergeometric mass from start outward, for arrays.
+
+    Sums pmf(start) + pmf(start+step) + ... with step -1 or +1
+    pointing away from the mode, so the terms only decrease. Each
+    term is derived from the previous by the pmf ratio, and a cell
+    drops out once its terms no longer change the sum. Only cells 
+    in the where mask are summed; others get -inf.
+    """
+    shape = start.shape
+    start, step, total, row, col, where = (np.ravel(x) for x in 
+                                           (start, step, total, row, col, where))
+    log_start = hypergeom_logpmf(start, total, row, col)
+    sums = np.ones_like(start)
+    active = np.flatnonzero(where & np.isfinite(log_start))
+    x, step = start[active], step[active]
+    total, row, col = total[active], row[active], col[active]
+    term = np.ones_like(x)
+    while active.size:
+        # pmf(x-1)/pmf(x) and pmf(x+1)/pmf(x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(step < 0,
+                             x * (total - row - col + x) / ((col - x + 1) * (row - x + 1)),
+                             (col - x) * (row - x) / ((x + 1) * (total - row - col + x + 1)))
+        term *= np.nan_to_num(ratio, nan=0.0)
+        x += step
+        sums[active] += term
+        keep = term > sums[active] * np.finfo(float).eps
+        active, x, step, term = active[keep], x[keep], step[keep], term[keep]
+        total, row, col = total[keep], row[keep], col[keep]
+    with np.errstate(divide='ignore'):
+        return np.where(where, log_start + np.log(sums), -np.inf).reshape(shape)
+
+def fishers_exact(a, b, c, d, rtol=1e-7):
+    """Calculate two-sided Fisher's Exact Test for arrays of tables.
+
+    This is a batch version of scipy.stats.fisher_exact. 
+    Each position in the a, b, c, d arrays is treated as one 
+    2x2 contingency table, and all tables are tested at once 
+    with NumPy operations rather than one call per cell. 
+
+    The two-sided p-value is the sum of probabilities of all 
+    tables with the same margins that are at most as likely 
+    as the observed one (the same definition scipy uses). 
+    Probabilities are compared in log-space: the opposite 
+    tail's boundary is located by a vectorized bisection of 
+    the log pmf, and both tails are then summed outward from 
+    their first table until the remaining terms are negligible.
+
+    Arguments:
+        a, b, c, d: array-likes of counts with broadcastable shapes
+        rtol: relative tolerance for treating two table 
+            probabilities as equal
+
+    Returns:
+        2-tuple of arrays as (p-values, odds_ratios) with 
+        the broadcast shape of the inputs
+    """
+    a, b, c, d = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64)
+                                         for x in (a, b, c, d)))
+    row = a + b
+    col = a + c
+    total = row + c + d
+
+    # odds ratios follow scipy: inf if b or c is 0, nan for empty margins
+    degenerate = (row == 0) | (col == 0) | (c + d == 0) | (b + d == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        odds = np.where((b > 0) & (c > 0), (a * d) / (b * c), np.inf)
+    odds = np.where(degenerate, np.nan, odds)
+
+    # locate the mode and the observed table's probability
+    lower = np.maximum(0, row + col - total)
+    upper = np.minimum(row, col)
+    mode = np.floor((col + 1) * (row + 1) / (total + 2))
+    log_pa = hypergeom_logpmf(a, total, row, col)
+    threshold = log_pa + np.log1p(rtol)
+    at_mode = threshold >= hypergeom_logpmf(mode, total, row, col)
+    left = a < mode
+
+    # the observed tail, and the start of the opposite tail
+    # for A left of the mode, the opposite tail lies between mode and upper
+    # for A right of the mode, between lower and mode
+    far = np.where(left, upper, lower)
+    has_far = hypergeom_logpmf(far, total, row, col) <= threshold
+    inside = np.where(has_far, mode, far)
+    boundary = _tail_boundary(inside, far, total, row, col, threshold)
+
+    # sum both tails outward, away from the mode
+    todo = ~(at_mode | degenerate)
+    outward = np.where(left, -1.0, 1.0)
+    p = (np.exp(_log_tail(a, outward, total, row, col, todo))
+            + np.exp(_log_tail(boundary, -outward, total, row, col, todo & has_far)))
+    p = np.where(todo, np.minimum(p, 1.0), 1.0)
+    return (p, odds)
+
+def transform_pvalues(p_values, a, e, logtransform=True, sign=True):
+    """Sign and/or log10 transform Fisher's p-values.
+
+    Follows Stefanowitsch and Gries 2003: values where the
+    observed frequency (A) is below the expected frequency (E)
+    are counted as repulsion and made negative, all others as 
+    attraction. The log10 transform turns p-values into 
+    strengths ranging from -inf to +inf.
+
+    Arguments:
+        p_values: array of p-values
+        a: array of observed frequencies
+        e: array of expected frequencies
+        logtransform: apply -log10 to p-values
+        sign: apply signs to untransformed p-values;
+            log-transformed values are always signed
+
+    Returns:
+        array of transformed values
+    """
+    repulsion = np.asarray(a) < np.asarray(e)
+    if not logtransform:
+        if not sign:
+            return np.asarray(p_values)
+        return np.where(repulsion, -p_values, p_values)
+    with np.errstate(divide='ignore'):
+        strength = -np.log10(p_values) # NB: log of decimal is negative
+    return np.where(repulsion, -strength, strength)
+
+def _pair_codes(x, y):
+    """Number the distinct (x, y) pairs of two integer arrays.
+
+    Returns the code of every pair and the number of codes.
+    """
+    x = x - x.min() if x.size else x
+    y = y - y.min() if y.size else y
+    if x.size and int(x.max()) * (int(y.max()) + 1) + int(y.max()) > np.iinfo(np.int64).max:
+        # too wide to pack as they are; pack their value codes instead
+        x = np.unique(x, return_inverse=True)[1].ravel()
+        y = np.unique(y, return_inverse=True)[1].ravel()
+    packed = x * (int(y.max()) + 1 if y.size else 1) + y
+    pairs, codes = np.unique(packed, return_inverse=True)
+    return codes.ravel(), pairs.size
+
+class FisherCache:
+    """Bounded, persistable cache of Fisher's exact results.
+
+    Co-occurrence tables repeat the same small 2x2 tables many 
+    times (hapax cells, zero cells, samples with equal margins). 
+    The cache maps each integer (a, b, c, d) table to its 
+    (p-value, odds ratio) so that a table is only tested once, 
+    within a call and across calls. Least recently used tables 
+    are evicted once maxsize is reached.
+
+    Use cache.fishers_exact as a drop-in for fishers_exact, or 
+    pass the cache to apply_fishers / apply_fishers_sparse.
+    Counters:
+        hits / misses: distinct tables found / not found in the cache
+        cells: number of cells looked up in total
+    """
+
+    def __init__(self, maxsize=1000000):
+        self.maxsize = maxsize
+        self._results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.cells = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    def fishers_exact(self, a, b, c, d):
+        """Cached version of fishers_exact; counts must be integers."""
+        a, b, c, d = np.broadcast_arrays(a, b, c, d)
+        shape = a.shape
+        a, b, c, d = [np.rint(x).astype(np.int64).ravel() for x in (a, b, c, d)]
+        # dedup on one int64 code per cell, packed from (a, b) and (c, d) pair codes
+        ab, ab_count = _pair_codes(a, b)
+        cd, cd_count = _pair_codes(c, d)
+        _, first, inverse = np.unique(ab * cd_count + cd, return_index=True, 
+                                      return_inverse=True)
+        tables = np.stack([a[first], b[first], c[first], d[first]], axis=-1)
+        results = np.empty((tables.shape[0], 2))
+
+        # look up every distinct table once
+        missing = []
+        for i, table in enumerate(map(tuple, tables.tolist())):
+            result = self._results.get(table)
+            if result is None:
+                missing.append(i)
+            else:
+                self._results.move_to_end(table)
+                results[i] = result
+        self.hits += tables.shape[0] - len(missing)
+        self.misses += len(missing)
+        self.cells += a.size
+
+        # test the new ones together and store them
+        if missing:
+            new = tables[missing]
+            p_values, oddsratios = fishers_exact(*new.T)
+            results[missing, 0] = p_values
+            results[missing, 1] = oddsratios
+            for table, result in zip(map(tuple, new.tolist()), results[missing].tolist()):
+                self._results[table] = tuple(result)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+        results = results[inverse.ravel()]
+        return (results[:, 0].reshape(shape), results[:, 1].reshape(shape))
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        lookups = self.hits + self.misses
+        return {'size': len(self), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'cells': self.cells,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        self._results.clear()
+        self.hits = self.misses = self.cells = 0
+
+    def save(self, path):
+        """Save cached results to a .npz file, oldest first."""
+        tables = np.array(list(self._results.keys()), dtype=np.int64).reshape(-1, 4)
+        results = np.array(list(self._results.values()), dtype=np.float64).reshape(-1, 2)
+        np.savez_compressed(path, tables=tables, results=results)
+
+    @classmethod
+    def load(cls, path, maxsize=1000000):
+        """Make a cache holding the results saved at path."""
+        cache = cls(maxsize=maxsize)
+        with np.load(path) as saved:
+            tables, results = saved['tables'], saved['results']
+        for table, result in zip(map(tuple, tables[-maxsize:].tolist()), 
+                                 results[-maxsize:].tolist()):
+            cache._results[table] = tuple(result)
+        return cache
+
+class RunReport:
+    """Progress and timing record of a significance run.
+
+    Pass one to apply_fishers as report= to get structured 
+    timings out of a run instead of reading printed output.
+    Time is recorded per phase:
+
+        margins: building the ContingencyTable (sample/feature margins)
+        table: deriving B, C, D, E
+        tests: Fisher's tests and transforms
+        packaging: building the output DataFrames
+
+    In parallel runs, table and tests are the summed time spent
+    in the workers. Progress is reported after every block of 
+    cells by calling callback with the dict from progress(); 
+    print_progress is a ready-made callback.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = collections.OrderedDict()
+        self.cells = 0
+        self.done = 0
+        self.elapsed = 0.0
+        self._start = None
+
+    def start(self):
+        self.done = 0
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Add the time spent in the with-block to phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def advance(self, cells):
+        """Record that a number of cells were scored."""
+        self.done += cells
+        if self.callback is not None:
+            self.callback(self.progress())
+
+    def progress(self):
+        """Return done / total cells, throughput and ETA in seconds."""
+        elapsed = time.perf_counter() - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        return {
+            'done': self.done,
+            'cells': self.cells,
+            'fraction': self.done / self.cells if self.cells else 1.0,
+            'elapsed': elapsed,
+            'cells_per_second': rate,
+            'eta': (self.cells - self.done) / rate if rate else None,
+        }
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._start
+
+    def as_dict(self):
+        """Return the run's totals and per-phase timings."""
+        return {
+            'cells': self.cells,
+            'elapsed': self.elapsed,
+            'cells_per_second': self.cells / self.elapsed if self.elapsed else 0.0,
+            'phases': dict(self.phases),
+        }
+
+def print_progress(progress):
+    """Progress callback for RunReport that prints a status line."""
+    eta = progress['eta']
+    print('{:>10.1f}s\t{:>12,} / {:,} cells ({:.1%})\t{:,.0f} cells/s\tETA {}'.format(
+        progress['elapsed'], progress['done'], progress['cells'], 
+        progress['fraction'], progress['cells_per_second'],
+        '-' if eta is None else '{:.1f}s'.format(eta)))
+
+# margins shared with the worker processes of apply_fishers;
+# set once per worker by the pool initializer
+_worker_state = {}
+
+def _init_fishers_worker(feat_margins, total, logtransform, sign):
+    _worker_state.update(feat_margins=feat_margins, total=total,
+                         logtransform=logtransform, sign=sign)
+
+def _fishers_block(a, samp_margins):
+    """Score one block of sample rows inside a worker process."""
+    start = time.perf_counter()
+    a, b, c, d, e = derive_contingencies(a, samp_margins[:, None],
+                                         _worker_state['feat_margins'][None, :],
+                                         _worker_state['total'])
+    built = time.perf_counter()
+    p_values, oddsratios = fishers_exact(a, b, c, d)
+    strengths = transform_pvalues(p_values, a, e,
+                                  logtransform=_worker_state['logtransform'],
+                                  sign=_worker_state['sign'])
+    timings = {'table': built - start, 'tests': time.perf_counter() - built}
+    return (strengths, oddsratios, timings)
+
+def _row_blocks(nrows, block_size):
+    return [slice(i, min(i + block_size, nrows)) for i in range(0, nrows, block_size)]
+
+def _fishers_parallel(table, processes, block_size, logtransform, sign, report):
+    """Score a ContingencyTable in row blocks over a process pool.
+
+    Every worker receives the feature margins and total once, 
+    when it starts; each task only carries its block of A and 
+    the matching sample margins. Blocks are returned in order, 
+    and every cell is scored independently, so the result does
+    not depend on the number of processes or the block size.
+    """
+    nrows = table.shape[0]
+    if block_size is None:
+        block_size = max(1, -(-nrows // (processes * 4))) # ~4 blocks per process
+    blocks = _row_blocks(nrows, block_size)
+    a_blocks = (table._dense(rows) for rows in blocks)
+    margin_blocks = (table.samp_margins[rows] for rows in blocks)
+    initargs = (table.feat_margins, table.total, logtransform, sign)
+    strengths, oddsratios = [], []
+    with ProcessPoolExecutor(processes, initializer=_init_fishers_worker, 
+                             initargs=initargs) as pool:
+        for strength, odds, timings in pool.map(_fishers_block, a_blocks, margin_blocks):
+            strengths.append(strength)
+            oddsratios.append(odds)
+            for phase, seconds in timings.items():
+                report.add_phase(phase, seconds)
+            report.advance(strength.size)
+    return (np.concatenate(strengths), np.concatenate(oddsratios))
+
 def apply_fishers(df, sample_axis, feature_axis, 
-                 logtransform=True, sign=True):
+                 logtransform=True, sign=True, 
+                 processes=None, block_size=None, cache=None,
+                 report=None):
     """Calculate Fisher's Exact Test with optional log10 transform.
 
     This function applies Fisher's Exact test to every 
@@ -123,6 +803,11 @@ def apply_fishers(df, sample_axis, feature_axis,
     The resulting values "range from - infinitity (mutual repulsion) 
     to + infinity (mutual attraction)" (Levshina 2015, 232). 
 
+    All cells are tested at once with fishers_exact. For big 
+    tables, processes > 1 splits the samples into row blocks that 
+    are scored in a process pool; the results are identical to
+    a single-process run.
+
     Arguments:
         df: a dataframe with co-occurrence frequencies in shape
             of samples*features or feature*samples
@@ -130,6 +815,17 @@ def apply_fishers(df, sample_axis, feature_axis,
             the sample population
         feature_axis: 0 (row) or 1 (column); axis that contains
             the collocating features on samples
+        logtransform: return signed -log10 p-values
+        sign: make p-values of repulsions negative
+        processes: number of worker processes; None or 1
+            runs in the current process
+        block_size: number of samples per block; defaults to
+            about 1,000,000 cells per block, or about 4 tasks
+            per process
+        cache: optional FisherCache to reuse results from; 
+            only works in the current process
+        report: optional RunReport to record progress and 
+            per-phase timings in
 
     Returns:
         2-tuple of (p-values, odds_ratios) in DataFrames
@@ -138,55 +834,46 @@ def apply_fishers(df, sample_axis, feature_axis,
     # put data in sample * feature format for calculations
     # will flip it back at end if needed
     df = normalize_axes(df, sample_axis, feature_axis)
-    a_df, b_df, c_df, d_df, e_df = contingency_table(df, 0, 1)
-    ps = collections.defaultdict(lambda: collections.defaultdict())
-    odds = collections.defaultdict(lambda: collections.defaultdict())
-
-    # Calculate Fisher's value-by-value
-    # I'm not yet sure if there's a better way to do this
-    for sample in df.index:
-        for feature in df.columns: 
-
-            # exctract contingencies 
-            a = df[feature][sample]
-            b = b_df[feature][sample]
-            c = c_df[feature][sample]
-            d = d_df[feature][sample]
-            expected_freq = e_df[feature][sample]
-
-            # run Fisher's
-            contingency = np.matrix([[a, b], [c, d]])
-            oddsratio, p_value = stats.fisher_exact(contingency)
-            
-            # save and transform? scores
-            odds[feature][sample] = oddsratio
-            if not logtransform:
-                if not sign:
-                    ps[feature][sample] = p_value
-
-                # apply signs
-                else:
-                    if a < expected_freq:
-                        ps[feature][sample] = -p_value
-                    else:
-                        ps[feature][sample] = p_value
-
-            # apply logtransform 
-            else:
-                if a < expected_freq:
-                    with np.errstate(divide='ignore'):
-                        strength = np.log10(p_value) # NB: log of decimal is negative
-                else:
-                    with np.errstate(divide='ignore'):
-                        strength = -np.log10(p_value) # NB: *-1 makes negative result positive
-                ps[feature][sample] = strength
+    report = RunReport() if report is None else report
+    report.start()
+    with report.phase('margins'):
+        table = ContingencyTable(df.values)
+    report.cells = table.a.size
+
+    # run Fisher's block-wise, in this process or in parallel
+    if processes is not None and processes > 1:
+        if cache is not None:
+            raise Exception('A FisherCache cannot be used with processes > 1')
+        strengths, oddsratios = _fishers_parallel(table, processes, block_size,
+                                                  logtransform, sign, report)
+    else:
+        test = fishers_exact if cache is None else cache.fishers_exact
+        strengths = np.empty(table.shape)
+        oddsratios = np.empty(table.shape)
+        block_size = block_size or max(1, 1000000 // max(table.shape[1], 1))
+        for rows in _row_blocks(table.shape[0], block_size):
+            with report.phase('table'):
+                a, b, c, d, e = table.block(rows)
+            with report.phase('tests'):
+                p_values, oddsratios[rows] = test(a, b, c, d)
+                strengths[rows] = transform_pvalues(p_values, a, e,
+                                                    logtransform=logtransform, 
+                                                    sign=sign)
+            report.advance(a.size)
 
     # package into dfs, flip axis back if needed
-    orient = 'columns' if sample_axis == 0 else 'index' 
-    ps = pd.DataFrame.from_dict(ps, orient=orient)
-    odds = pd.DataFrame.from_dict(odds, orient=orient)
+    with report.phase('packaging'):
+        ps = pd.DataFrame(strengths, index=df.index, columns=df.columns)
+        odds = pd.DataFrame(oddsratios, index=df.index, columns=df.columns)
+        if sample_axis == 1:
+            ps, odds = ps.T, odds.T
+    report.finish()
     return (ps, odds)
 
+def _deltaP(a, b, c, d, e):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a/(a+b) - c/(c+d)
+
 def apply_deltaP(df, sample_axis, feature_axis):
     """Apply ΔP unidirectional association measure to table.
 
@@ -225,6 +912,311 @@ def apply_deltaP(df, sample_axis, feature_axis):
     """
     
     # get contingency data and calculate ΔP
-    a,b,c,d,e = contingency_table(df, sample_axis, feature_axis)
-    delta_p = a/(a+b) - c/(c+d)
+    table = ContingencyTable.from_frame(df, sample_axis, feature_axis)
+    delta_p = pd.DataFrame(_deltaP(*table.block()), 
+                           index=table.index, columns=table.columns)
+    if sample_axis == 1:
+        delta_p = delta_p.T
     return delta_p
+
+def sparse_contingency_table(matrix, sample_axis, feature_axis, 
+                             index=None, columns=None):
+    """Build contingency data for a scipy.sparse co-occurrence matrix.
+
+    The sparse counterpart of contingency_table. Rather than 
+    five dense tables it returns a ContingencyTable view holding 
+    the sparse counts and margin vectors. Samples are put in rows.
+
+    Arguments:
+        matrix: scipy.sparse matrix (CSR or CSC) with co-occurrence 
+            frequencies in shape of samples*features or feature*samples
+        sample_axis: 0 (row) or 1 (column); axis that contains 
+            the sample population
+        feature_axis: 0 (row) or 1 (column); axis that contains
+            the collocating features on samples
+        index: labels for the matrix's rows
+        columns: labels for the matrix's columns
+
+    Returns:
+        ContingencyTable
+    """
+    return ContingencyTable.from_sparse(matrix, sample_axis, feature_axis, 
+                                        index=index, columns=columns)
+
+def apply_fishers_sparse(matrix, sample_axis, feature_axis, 
+                         index=None, columns=None,
+                         logtransform=True, sign=True, cache=None):
+    """Calculate Fisher's Exact Test over a sparse co-occurrence matrix.
+
+    Gives the same values as apply_fishers, without densifying 
+    the input. Non-zero cells are tested individually; zero cells 
+    are tested once per distinct pair of sample/feature margins.
+    Arguments are as for apply_fishers and sparse_contingency_table.
+
+    Returns:
+        2-tuple of (p-values, odds_ratios) as SparseScores
+        oriented samples*features
+    """
+    table = sparse_contingency_table(matrix, sample_axis, feature_axis, 
+                                     index=index, columns=columns)
+    test = fishers_exact if cache is None else cache.fishers_exact
+
+    def fishers(a, b, c, d, e):
+        p_values, oddsratios = test(a, b, c, d)
+        strengths = transform_pvalues(p_values, a, e,
+                                      logtransform=logtransform, sign=sign)
+        return (strengths, oddsratios)
+
+    return score_sparse(table, fishers)
+
+def apply_deltaP_sparse(matrix, sample_axis, feature_axis, 
+                        index=None, columns=None):
+    """Apply ΔP to a sparse co-occurrence matrix.
+
+    Gives the same values as apply_deltaP, without densifying 
+    the input. Arguments are as for apply_deltaP and 
+    sparse_contingency_table.
+
+    Returns:
+        SparseScores oriented samples*features
+    """
+    table = sparse_contingency_table(matrix, sample_axis, feature_axis, 
+                                     index=index, columns=columns)
+    return score_sparse(table, _deltaP)
+
+# measures known to association_measures, in output order
+ASSOCIATION_MEASURES = ('fisher', 'odds_ratio', 'log_odds', 'log_odds_lower', 
+                        'log_odds_upper', 'deltaP', 'deltaP_reverse', 
+                        'log_likelihood', 'chi_square', 'pmi', 'ppmi', 't_score')
+
+def _association_scores(a, b, c, d, e, measures, ci=0.95):
+    """Compute a set of association measures from one set of contingencies.
+
+    Intermediate values (Fisher's test, log odds, PMI) are computed 
+    once and shared by the measures that need them.
+
+    Returns:
+        dict of measure name to array
+    """
+    a, b, c, d, e = (np.asarray(x, dtype=np.float64) for x in (a, b, c, d, e))
+    shared = {}
+    def once(name, compute):
+        if name not in shared:
+            shared[name] = compute()
+        return shared[name]
+
+    def fisher():
+        return fishers_exact(a, b, c, d)
+
+    def log_odds():
+        # Haldane-Anscombe correction keeps zero cells finite
+        ha, hb, hc, hd = a + 0.5, b + 0.5, c + 0.5, d + 0.5
+        log_or = np.log(ha * hd / (hb * hc))
+        se = np.sqrt(1/ha + 1/hb + 1/hc + 1/hd)
+        z = stats.norm.ppf((1 + ci) / 2)
+        return (log_or, log_or - z*se, log_or + z*se)
+
+    def pmi():
+        return np.log2(a / e)
+
+    def observed_expected():
+        # observed and expected frequencies of all 4 cells
+        n = a + b + c + d
+        rows, cols = (a + b, c + d), (a + c, b + d)
+        observed = (a, b, c, d)
+        expected = (rows[0]*cols[0]/n, rows[0]*cols[1]/n, 
+                    rows[1]*cols[0]/n, rows[1]*cols[1]/n)
+        return observed, expected
+
+    scores = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for measure in measures:
+            if measure == 'fisher':
+                p_values, _ = once('fisher', fisher)
+                scores[measure] = transform_pvalues(p_values, a, e)
+            elif measure == 'odds_ratio':
+                scores[measure] = once('fisher', fisher)[1]
+            elif measure == 'log_odds':
+                scores[measure] = once('log_odds', log_odds)[0]
+            elif measure == 'log_odds_lower':
+                scores[measure] = once('log_odds', log_odds)[1]
+            elif measure == 'log_odds_upper':
+                scores[measure] = once('log_odds', log_odds)[2]
+            elif measure == 'deltaP':
+                scores[measure] = _deltaP(a, b, c, d, e)
+            elif measure == 'deltaP_reverse':
+                scores[measure] = a/(a+c) - b/(b+d)
+            elif measure == 'log_likelihood':
+                observed, expected = once('observed_expected', observed_expected)
+                scores[measure] = 2 * sum(np.where(o > 0, o * np.log(o / ex), 0)
+                                          for o, ex in zip(observed, expected))
+            elif measure == 'chi_square':
+                n = a + b + c + d
+                scores[measure] = (n * (a*d - b*c)**2 
+                                   / ((a+b) * (c+d) * (a+c) * (b+d)))
+            elif measure == 'pmi':
+                scores[measure] = once('pmi', pmi)
+            elif measure == 'ppmi':
+                scores[measure] = np.maximum(once('pmi', pmi), 0)
+            elif measure == 't_score':
+                scores[measure] = (a - e) / np.sqrt(a)
+            else:
+                raise Exception(f'Unknown association measure: {measure}')
+    return scores
+
+def association_measures(data, sample_axis, feature_axis, measures=None,
+                         tidy=False, ci=0.95, index=None, columns=None):
+    """Calculate several association measures in one pass.
+
+    The contingency data (A, B, C, D, E) are built once and 
+    every requested measure is computed from them, vectorized 
+    over all cells. Available measures (ASSOCIATION_MEASURES):
+
+        fisher: signed -log10 Fisher's p-value, as apply_fishers
+        odds_ratio: sample odds ratio, as apply_fishers
+        log_odds, log_odds_lower, log_odds_upper: natural log 
+            odds ratio with its confidence interval (Woolf), with 
+            0.5 added to every cell (Haldane-Anscombe correction)
+        deltaP: ΔP with sample as cue, as apply_deltaP
+            >> a/(a+b) - c/(c+d)
+        deltaP_reverse: ΔP with feature as cue
+            >> a/(a+c) - b/(b+d)
+        log_likelihood: G² = 2 * Σ O * ln(O/E) over the 4 cells
+        chi_square: Pearson's χ² without continuity correction
+            >> N * (ad - bc)² / ((a+b) * (c+d) * (a+c) * (b+d))
+        pmi: pointwise mutual information, log2(A/E)
+        ppmi: positive PMI, max(PMI, 0)
+        t_score: (A - E) / sqrt(A)
+
+    Arguments:
+        data: a dataframe with co-occurrence frequencies in shape
+            of samples*features or feature*samples, or a 
+            scipy.sparse matrix (see sparse_contingency_table)
+        sample_axis: 0 (row) or 1 (column); axis that contains 
+            the sample population
+        feature_axis: 0 (row) or 1 (column); axis that contains
+            the collocating features on samples
+        measures: iterable of measure names; default all
+        tidy: return one long frame instead of a dict
+        ci: confidence level for the log odds interval
+        index, columns: row/column labels for sparse data
+
+    Returns:
+        dict of measure name to DataFrame in the orientation of 
+        the input (SparseScores for sparse input); or, if tidy, 
+        a DataFrame with columns sample, feature and one column 
+        per measure (only non-zero cells for sparse input)
+    """
+    measures = list(ASSOCIATION_MEASURES if measures is None else measures)
+    score = lambda *cells: _association_scores(*cells, measures, ci=ci)
+
+    if sp.issparse(data):
+        table = sparse_contingency_table(data, sample_axis, feature_axis,
+                                         index=index, columns=columns)
+        scores = score_sparse(table, lambda *cells: tuple(score(*cells).values()))
+        scores = dict(zip(measures, scores))
+        if not tidy:
+            return scores
+        rows, cols = table.cells()[0]
+        values = {measure: scores[measure].observed.data for measure in measures}
+    else:
+        table = ContingencyTable.from_frame(data, sample_axis, feature_axis)
+        values = score(*table.block())
+        if not tidy:
+            frames = {measure: pd.DataFrame(values[measure], index=table.index,
+                                            columns=table.columns)
+                          for measure in measures}
+            if sample_axis == 1:
+                frames = {measure: frame.T for measure, frame in frames.items()}
+            return frames
+        rows, cols = np.indices(table.shape).reshape(2, -1)
+        values = {measure: values[measure].ravel() for measure in measures}
+
+    return pd.DataFrame({'sample': _label(table.index, rows),
+                         'feature': _label(table.columns, cols), **values})
+
+def top_associations(data, sample_axis, feature_axis, k=None, threshold=None,
+                     repulsions=False, index=None, columns=None, 
+                     block_size=None, cache=None):
+    """Extract only the strongest Fisher's associations per sample.
+
+    Instead of scoring and storing every cell like apply_fishers, 
+    this keeps the top k features per sample and/or the cells 
+    whose strength (signed -log10 p-value) reaches a threshold. 
+    Cells are pruned before testing: by default only attractions 
+    are wanted, so cells with A <= E are skipped, which includes 
+    all zero cells. The table is processed in blocks of samples 
+    and at most k cells per sample are kept from each block, so 
+    memory is bounded by the block size and k.
+
+    Arguments:
+        data: a dataframe with co-occurrence frequencies in shape
+            of samples*features or feature*samples, or a 
+            scipy.sparse matrix (see sparse_contingency_table)
+        sample_axis: 0 (row) or 1 (column); axis that contains 
+            the sample population
+        feature_axis: 0 (row) or 1 (column); axis that contains
+            the collocating features on samples
+        k: number of features to keep per sample; None keeps all
+            that pass the threshold
+        threshold: minimum strength to keep, e.g. 3 for p < 0.001;
+            compared to the absolute strength if repulsions 
+        repulsions: also consider repulsions (A < E) and rank 
+            cells by absolute strength
+        index, columns: row/column labels for sparse data
+        block_size: number of samples per block; defaults to
+            about 1,000,000 cells per block
+        cache: optional FisherCache
+
+    Returns:
+        DataFrame with columns sample, feature, a, expected, 
+        p_value, strength, rank; sorted by sample and rank
+    """
+    if k is None and threshold is None:
+        raise Exception('Give k and/or threshold to prune associations')
+    if sp.issparse(data):
+        table = sparse_contingency_table(data, sample_axis, feature_axis,
+                                         index=index, columns=columns)
+    else:
+        table = ContingencyTable.from_frame(data, sample_axis, feature_axis)
+    test = fishers_exact if cache is None else cache.fishers_exact
+    nrows, ncols = table.shape
+    block_size = block_size or max(1, 1000000 // max(ncols, 1))
+
+    found = []
+    for rows in _row_blocks(nrows, block_size):
+        a, b, c, d, e = table.block(rows)
+
+        # prune cells that cannot be wanted before testing
+        candidates = (a != e) if repulsions else (a > e)
+        block_rows, cols = np.nonzero(candidates)
+        a, b, c, d, e = (x[block_rows, cols] for x in (a, b, c, d, e))
+        p_values, _ = test(a, b, c, d)
+        strength = transform_pvalues(p_values, a, e)
+        score = np.abs(strength) if repulsions else strength
+        keep = np.ones(score.shape, dtype=bool)
+        if threshold is not None:
+            keep &= score >= threshold
+
+        # keep the k best per sample
+        order, rank = _rank_by_row(block_rows[keep], score[keep])
+        if k is not None:
+            order, rank = order[rank < k], rank[rank < k]
+        kept = np.flatnonzero(keep)[order]
+        found.append(pd.DataFrame({
+            'sample': block_rows[kept] + rows.start,
+            'feature': cols[kept],
+            'a': a[kept],
+            'expected': e[kept],
+            'p_value': p_values[kept],
+            'strength': strength[kept],
+            'rank': rank,
+        }))
+
+    if not found: # a table without samples
+        return pd.DataFrame(columns=['sample', 'feature', 'a', 'expected',
+                                     'p_value', 'strength', 'rank'])
+    found = pd.concat(found, ignore_index=True)
+    found['sample'] = _label(table.index, found['sample'].values)
+    found['feature'] = _label(table.columns, found['feature'].values)
+    return found
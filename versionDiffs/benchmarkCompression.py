@@ -0,0 +1,102 @@
+'''
+Benchmark of the compression module:
+peak RSS and throughput of the previous whole-file
+copies against the streaming and parallel ones,
+on a synthetic .tf feature file.
+
+    python benchmarkCompression.py [megabytes] [threads]
+
+Each run happens in a fresh process, so that its
+peak RSS is its own.
+'''
+
+import sys, os, time, random, resource, tempfile, filecmp, bz2, gzip as gz
+from multiprocessing import get_context
+import compression
+
+def makeTfFile(path, megabytes):
+    rnd = random.Random(0)
+    values = ['subs', 'verb', 'prep', 'nmpr', 'prps', 'art', 'conj', 'advb', 'adjv', 'intj']
+    with open(path, 'w') as h:
+        h.write('@node\n@valueType=str\n@description=synthetic feature\n\n')
+        n = 0
+        while h.tell() < megabytes * 1024 * 1024:
+            n += 1
+            h.write('{}\t{}\n'.format(n, rnd.choice(values)) if rnd.random() < 0.1 else '{}\n'.format(rnd.choice(values)))
+
+def wholeBzip(uzFile, bzFile):
+    with bz2.open(bzFile, mode='wt') as bdata:
+        with open(uzFile, 'r') as udata:
+            bdata.write(udata.read())
+
+def wholeGzip(uzFile, gzFile):
+    with gz.open(gzFile, mode='wt') as gdata:
+        with open(uzFile, 'rt') as udata:
+            gdata.write(udata.read())
+
+def wholeBunzip(bzFile, uzFile):
+    with bz2.open(bzFile, mode='rt') as bdata:
+        with open(uzFile, 'w') as udata:
+            udata.write(bdata.read())
+
+def wholeGunzip(gzFile, uzFile):
+    with gz.open(gzFile, mode='rt') as gdata:
+        with open(uzFile, 'w') as udata:
+            udata.write(gdata.read())
+
+def _measure(conn, function, args, kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    conn.send((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    conn.close()
+
+def measure(function, *args, **kwargs):
+    # (seconds, peak RSS in MB) of a call in a fresh process
+    ctx = get_context('spawn')
+    parent, child = ctx.Pipe()
+    process = ctx.Process(target=_measure, args=(child, function, args, kwargs))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+def benchmark(megabytes=200, threads=None):
+    threads = threads or os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        tfFile = '{}/feature.tf'.format(tmp)
+        outFile = '{}/out.tf'.format(tmp)
+        makeTfFile(tfFile, megabytes)
+        size = os.path.getsize(tfFile) / 1024 / 1024
+        results = []
+        for (ext, whole, unwhole) in (
+            ('bz2', wholeBzip, wholeBunzip),
+            ('gz', wholeGzip, wholeGunzip),
+        ):
+            zFile = '{}/feature.tf.{}'.format(tmp, ext)
+            for (label, function, args) in (
+                ('{} whole file'.format(ext), whole, ()),
+                ('{} streaming'.format(ext), compression.compress, (ext, 1)),
+                ('{} {} threads'.format(ext, threads), compression.compress, (ext, threads)),
+            ):
+                if os.path.exists(zFile): os.remove(zFile)
+                (elapsed, rss) = measure(function, tfFile, zFile, *args)
+                results.append((label, elapsed, size / elapsed, rss))
+            for (label, function, args) in (
+                ('un{} whole file'.format(ext), unwhole, ()),
+                ('un{} streaming'.format(ext), compression.decompress, (ext,)),
+            ):
+                if os.path.exists(outFile): os.remove(outFile)
+                (elapsed, rss) = measure(function, zFile, outFile, *args)
+                same = filecmp.cmp(outFile, tfFile, shallow=False)
+                results.append((label + ('' if same else ' MISMATCH'), elapsed, size / elapsed, rss))
+    print('{:.0f} MB synthetic .tf file'.format(size))
+    print('{:<22} {:>9} {:>9} {:>13}'.format('', 'seconds', 'MB/s', 'peak RSS MB'))
+    for (label, elapsed, rate, rss) in results:
+        print('{:<22} {:>9.2f} {:>9.1f} {:>13.1f}'.format(label, elapsed, rate, rss))
+    return results
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    benchmark(megabytes, threads)
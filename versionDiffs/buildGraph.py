@@ -0,0 +1,190 @@
+'''
+A content-hash incremental build graph, as a successor
+of mustRun in utils.
+
+Tasks declare their input and output paths, and a task
+depends on the tasks that make its inputs. A manifest of
+content hashes decides which tasks are stale, and stale
+tasks whose dependencies are done run concurrently.
+'''
+
+import os, collections, hashlib, json, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from featureDiffs import fileHash
+from utils import caption
+
+def fileEntry(path, known=None):
+    # {hash, size, mtime} of a file; known is a previous entry, reused if size and mtime are the same.
+    st = os.stat(path)
+    if known and known.get('size') == st.st_size and known.get('mtime') == st.st_mtime:
+        return known
+    return dict(hash=fileHash(path), size=st.st_size, mtime=st.st_mtime)
+
+def pathHash(path, known=None):
+    # content hash of a file, or of a directory's files and their names; None if missing.
+    # known is the previous entry of the path: the entries of a file and of the files
+    # in a directory are reused if their size and mtime are the same.
+    if not os.path.exists(path): return None
+    if os.path.isdir(path):
+        knownFiles = (known or {}).get('files', {})
+        files = {}
+        h = hashlib.sha1()
+        for (root, dirs, names) in sorted(os.walk(path)):
+            for f in sorted(names):
+                fPath = os.path.join(root, f)
+                rel = os.path.relpath(fPath, path)
+                files[rel] = fileEntry(fPath, knownFiles.get(rel))
+                h.update(rel.encode())
+                h.update(files[rel]['hash'].encode())
+        return dict(hash=h.hexdigest(), files=files)
+    return fileEntry(path, known)
+
+class Task(object):
+    def __init__(self, name, run, inputs=(), outputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = set()
+
+class BuildGraph(object):
+    # Tasks declare input and output paths; a task depends on the tasks that make its inputs.
+    # A manifest of content hashes of every task's inputs and outputs after its last
+    # successful run is kept in manifestPath. A task is stale if an output is missing,
+    # or if an input or output hash differs from the manifest, so touching a file
+    # does not trigger work. Stale tasks whose dependencies are done run concurrently.
+    # With force=True every task runs, as with mustRun.
+
+    def __init__(self, manifestPath, workers=None):
+        self.manifestPath = manifestPath
+        self.workers = workers
+        self.tasks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.manifest = {}
+        if os.path.exists(manifestPath):
+            with open(manifestPath) as h: self.manifest = json.load(h)
+
+    def task(self, name, run, inputs=(), outputs=()):
+        if name in self.tasks:
+            raise Exception('Task {} is already defined'.format(name))
+        self.tasks[name] = Task(name, run, inputs, outputs)
+        return self.tasks[name]
+
+    def _link(self):
+        makers = {}
+        for t in self.tasks.values():
+            for o in t.outputs:
+                if o in makers:
+                    raise Exception('Output {} is made by {} and {}'.format(o, makers[o], t.name))
+                makers[o] = t.name
+        for t in self.tasks.values():
+            t.deps = {makers[i] for i in t.inputs if i in makers} - {t.name}
+
+    def _hashes(self, paths, known):
+        return {p: pathHash(p, known.get(p)) for p in paths}
+
+    def _state(self, t):
+        entry = self.manifest.get(t.name, {})
+        return (
+            self._hashes(t.inputs, entry.get('inputs', {})),
+            self._hashes(t.outputs, entry.get('outputs', {})),
+        )
+
+    def _same(self, hashes, recorded):
+        return set(hashes) == set(recorded) and all(
+            h != None and recorded[p] != None and h['hash'] == recorded[p]['hash']
+            for (p, h) in hashes.items()
+        )
+
+    def isStale(self, name):
+        t = self.tasks[name]
+        entry = self.manifest.get(t.name)
+        if entry == None: return True
+        (inputs, outputs) = self._state(t)
+        return not (self._same(inputs, entry['inputs']) and self._same(outputs, entry['outputs']))
+
+    def _save(self):
+        tempPath = '{}.tmp'.format(self.manifestPath)
+        with open(tempPath, 'w') as h: json.dump(self.manifest, h, indent=1, sort_keys=True)
+        os.replace(tempPath, self.manifestPath)
+
+    def _execute(self, t):
+        caption(0, '\tTask {} running'.format(t.name))
+        t.run()
+        missing = [o for o in t.outputs if not os.path.exists(o)]
+        if missing:
+            raise Exception('Task {} did not make {}'.format(t.name, ', '.join(missing)))
+        (inputs, outputs) = self._state(t)
+        with self.lock:
+            self.manifest[t.name] = dict(inputs=inputs, outputs=outputs)
+            self._save()
+
+    def run(self, force=False, only=None):
+        # returns (good, names of tasks that ran)
+        self._link()
+        names = set(self.tasks) if only == None else set(only)
+        todo = set()
+        for name in self.tasks:
+            if name in names: todo |= {name} | self._upstream(name)
+        good = True
+        done = set()
+        failed = set()
+        ran = []
+        running = {}
+        with ThreadPoolExecutor(self.workers) as pool:
+            while todo or running:
+                progress = False
+                for name in [n for n in self.tasks if n in todo]:
+                    t = self.tasks[name]
+                    if t.deps & failed:
+                        caption(0, '\tTask {} skipped: a dependency failed'.format(name))
+                        todo.discard(name)
+                        failed.add(name)
+                        progress = True
+                        continue
+                    if not t.deps <= done: continue
+                    todo.discard(name)
+                    progress = True
+                    absent = [i for i in t.inputs if not os.path.exists(i)]
+                    if absent:
+                        if all(os.path.exists(o) for o in t.outputs):
+                            caption(0, '\tTask {}: source {} does not exist, destination counts as up to date'.format(name, ', '.join(absent)))
+                            done.add(name)
+                        else:
+                            caption(0, '\tTask {} cannot run: source {} is missing'.format(name, ', '.join(absent)))
+                            failed.add(name)
+                            good = False
+                        continue
+                    if not self.isStale(name):
+                        if not force:
+                            caption(0, '\tTask {} up to date'.format(name))
+                            done.add(name)
+                            continue
+                        caption(0, 'NOTE: task {} seems up to date. Will be run because of "force=True"'.format(name))
+                    running[pool.submit(self._execute, t)] = name
+                if not running:
+                    if not progress:
+                        raise Exception('Tasks {} depend on each other'.format(', '.join(sorted(todo))))
+                    continue
+                (finished, pending) = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error != None:
+                        caption(0, '\tTask {} failed: {}'.format(name, error))
+                        failed.add(name)
+                        good = False
+                    else:
+                        done.add(name)
+                        ran.append(name)
+        return (good, ran)
+
+    def _upstream(self, name):
+        seen = set()
+        stack = list(self.tasks[name].deps)
+        while stack:
+            d = stack.pop()
+            if d not in seen:
+                seen.add(d)
+                stack.extend(self.tasks[d].deps)
+        return seen
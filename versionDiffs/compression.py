@@ -0,0 +1,59 @@
+'''
+Streaming compression of TF feature files, to call
+instead of bzip, bunzip, gzip and gunzip in utils,
+which read whole files into memory.
+
+Files are copied through a fixed-size buffer, so memory
+does not grow with the file size. compress with threads > 1
+compresses blocks of the file in parallel and writes them
+as consecutive streams, which bz2 and gzip readers
+decompress as one file.
+'''
+
+import collections, bz2, gzip as gz
+from concurrent.futures import ThreadPoolExecutor
+
+BUFFER_SIZE = 1024 * 1024     # chunk size of streaming copies
+BLOCK_SIZE = 8 * 1024 * 1024  # chunk size of parallel compression
+
+def stream(src, dst, bufferSize=BUFFER_SIZE):
+    while True:
+        data = src.read(bufferSize)
+        if not data: break
+        dst.write(data)
+
+def _gzipBlock(data):
+    return gz.compress(data, compresslevel=9)
+
+def _bzipBlock(data):
+    return bz2.compress(data, 9)
+
+openers = dict(bz2=bz2.open, gz=gz.open)
+blockCompressors = dict(bz2=_bzipBlock, gz=_gzipBlock)
+
+def compressParallel(uzFile, zFile, compressBlock, threads, blockSize=BLOCK_SIZE):
+    # Compress text blocks independently in threads (zlib and bz2 release the GIL)
+    # and write them in order as consecutive streams, which gzip and bz2 readers
+    # decompress as one file. At most threads + 1 blocks are held in memory.
+    with open(uzFile, 'r') as udata, open(zFile, 'wb') as zdata:
+        encoding = udata.encoding
+        pending = collections.deque()
+        with ThreadPoolExecutor(threads) as pool:
+            for block in iter(lambda: udata.read(blockSize), ''):
+                pending.append(pool.submit(compressBlock, block.encode(encoding)))
+                if len(pending) > threads: zdata.write(pending.popleft().result())
+            while pending: zdata.write(pending.popleft().result())
+
+def compress(uzFile, zFile, kind, threads=1):
+    # kind is 'bz2' or 'gz'
+    if threads > 1:
+        compressParallel(uzFile, zFile, blockCompressors[kind], threads)
+        return
+    with openers[kind](zFile, mode='wt') as zdata:
+        with open(uzFile, 'r') as udata:
+            stream(udata, zdata)
+
+def decompress(zFile, uzFile, kind):
+    with openers[kind](zFile, mode='rt') as zdata:
+        with open(uzFile, 'w') as udata:
+            stream(zdata, udata)
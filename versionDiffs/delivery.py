@@ -0,0 +1,92 @@
+'''
+Incremental, atomic delivery of a TF dataset; its
+deliverDataset and deliverFeatures replace those in
+utils, which copy everything in place.
+
+The new contents of the target are built in a staging
+dir next to it, hardlinking files whose hash is the same
+as the delivered ones and copying the rest, and swapped
+in with renames.
+'''
+
+import os, collections, time
+from shutil import rmtree, copy2
+from featureDiffs import fileHash
+from utils import caption
+
+def filesIn(directory):
+    files = {}
+    for (root, dirs, names) in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, directory)] = path
+    return files
+
+def recoverDelivery(thisDeliver):
+    previous = '{}.old'.format(thisDeliver.rstrip('/'))
+    if not os.path.exists(thisDeliver) and os.path.exists(previous):
+        os.rename(previous, thisDeliver)
+
+def deliverAtomic(sources, thisDeliver):
+    # Build the new contents of thisDeliver in a staging dir next to it and swap it in.
+    # sources maps relative paths to source files. A source with the same hash as the
+    # file already delivered at that path is hardlinked from the delivered file,
+    # other sources are copied. The swap is two renames; a previous delivery
+    # interrupted between them is recovered from the .old dir first.
+    startTime = time.time()
+    thisDeliver = thisDeliver.rstrip('/')
+    staging = '{}.staging'.format(thisDeliver)
+    previous = '{}.old'.format(thisDeliver)
+    recoverDelivery(thisDeliver)
+    for path in (staging, previous):
+        if os.path.exists(path): rmtree(path)
+    delivered = filesIn(thisDeliver) if os.path.exists(thisDeliver) else {}
+    report = collections.Counter()
+    os.makedirs(staging)
+    for (rel, src) in sorted(sources.items()):
+        dst = os.path.join(staging, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        size = os.path.getsize(src)
+        old = delivered.get(rel)
+        if old != None and (os.path.samefile(old, src) or (
+            os.path.getsize(old) == size and fileHash(old) == fileHash(src)
+        )):
+            try:
+                os.link(old, dst)
+                report['linked'] += 1
+                report['bytesSaved'] += size
+                continue
+            except OSError:
+                pass
+        copy2(src, dst)
+        report['copied'] += 1
+        report['bytesCopied'] += size
+    report['removed'] = len(set(delivered) - set(sources))
+    if os.path.exists(thisDeliver):
+        os.rename(thisDeliver, previous)
+    os.rename(staging, thisDeliver)
+    if os.path.exists(previous): rmtree(previous)
+    report['seconds'] = round(time.time() - startTime, 2)
+    caption(0, '\t{} files unchanged and linked ({:.1f} MB not copied), {} copied ({:.1f} MB), {} removed in {}s'.format(
+        report['linked'], report['bytesSaved'] / 1024 / 1024,
+        report['copied'], report['bytesCopied'] / 1024 / 1024,
+        report['removed'], report['seconds'],
+    ))
+    return dict(report)
+
+def deliverDataset(thisSave, thisDeliver):
+    caption(4, 'Deliver data set to {}'.format(thisDeliver))
+    return deliverAtomic(filesIn(thisSave), thisDeliver)
+
+def deliverFeatures(thisSave, thisDeliver, newFeatures, deleteFeatures=None):
+    caption(4, 'Deliver features to {}'.format(thisDeliver))
+    recoverDelivery(thisDeliver)
+    sources = filesIn(thisDeliver) if os.path.exists(thisDeliver) else {}
+    for feature in newFeatures:
+        caption(0, '\t{}'.format(feature))
+        sources['{}.tf'.format(feature)] = '{}/{}.tf'.format(thisSave, feature)
+    for feature in deleteFeatures or ():
+        caption(0, '\tdelete {} ... {}'.format(
+            feature, 'deleted' if sources.pop('{}.tf'.format(feature), None) else 'was not present'
+        ))
+    return deliverAtomic(sources, thisDeliver)
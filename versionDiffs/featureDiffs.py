@@ -0,0 +1,192 @@
+'''
+Diffing of TF feature files between two versions of a
+dataset; checkDiffs here replaces checkDiffs in utils,
+which compares files line by line.
+
+Features whose streamed content hashes are the same
+are reported as unchanged without being diffed; the rest
+are diffed by streaming both files in node order and
+merging them on node, so that the counts of changed, added
+and removed values say how big a change is. With processes > 1
+features are diffed in a process pool.
+'''
+
+import os, hashlib
+from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+from compression import BUFFER_SIZE
+from utils import caption
+
+def fileHash(path, bufferSize=BUFFER_SIZE):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(bufferSize), b''):
+            h.update(data)
+    return h.hexdigest()
+
+def featureLines(path, isOtext):
+    # lines to compare: all lines of otext, the lines after the metadata for others
+    with open(path) as h:
+        for line in h:
+            if isOtext or not line.startswith('@'): yield line
+
+def contentHash(path, isOtext):
+    h = hashlib.sha1()
+    for line in featureLines(path, isOtext):
+        h.update(line.encode())
+    return h.hexdigest()
+
+def specNodes(spec):
+    # nodes of a TF node spec such as 5, 5-7 or 1,3-4
+    nodes = []
+    for part in spec.split(','):
+        (first, last) = part.split('-') if '-' in part else (part, part)
+        nodes.extend(range(int(first), int(last) + 1))
+    return nodes
+
+def featureItems(path):
+    # Stream the data of a feature file as (key, value) in key order: the key is the
+    # node of a node feature, with its value, or the (node, target) pair of an edge,
+    # with its edge value ('' without edge values). A line without a node spec is for
+    # the node after the last node of the previous line, and node specs with ranges
+    # and lists are expanded. The edges of one node are sorted by target before they
+    # are yielded. Data lines are those after the first empty line.
+    isEdge = False
+    edgeValues = False
+    inData = False
+    node = 0
+    edges = []
+    with open(path) as h:
+        for line in h:
+            line = line.rstrip('\n')
+            if not inData:
+                if line.startswith('@edgeValues'): edgeValues = True
+                elif line.startswith('@edge'): isEdge = True
+                elif not line: inData = True
+                continue
+            fields = line.split('\t')
+            if not isEdge:
+                nodes = specNodes(fields[0]) if len(fields) > 1 else [node + 1]
+                for n in nodes: yield (n, fields[-1])
+                node = nodes[-1]
+                continue
+            if len(fields) == (3 if edgeValues else 2):
+                nodes = specNodes(fields[0])
+                fields = fields[1:]
+            else:
+                nodes = [node + 1]
+            value = fields[1] if edgeValues else ''
+            for n in nodes:
+                if edges and edges[0][0][0] != n:
+                    yield from sorted(edges)
+                    edges = []
+                edges.extend(((n, m), value) for m in specNodes(fields[0]))
+            node = nodes[-1]
+    yield from sorted(edges)
+
+def configItems(path):
+    # the metadata of otext as (name, line), by name
+    with open(path) as h:
+        lines = [line.rstrip('\n') for line in h if line.startswith('@')]
+    return iter(sorted((line.split('=', 1)[0], line) for line in lines))
+
+def mergeItems(eItems, nItems):
+    # Merge two streams of (key, value) in key order and yield (key, old, new)
+    # for every key whose value differs, with None where a stream lacks the key.
+    e = next(eItems, None)
+    n = next(nItems, None)
+    while e != None or n != None:
+        if n == None or (e != None and e[0] < n[0]):
+            yield (e[0], e[1], None)
+            e = next(eItems, None)
+        elif e == None or n[0] < e[0]:
+            yield (n[0], None, n[1])
+            n = next(nItems, None)
+        else:
+            if e[1] != n[1]: yield (e[0], e[1], n[1])
+            e = next(eItems, None)
+            n = next(nItems, None)
+
+def diffFeature(f, existingPath, newPath, limit=4, cutOff=40):
+    # Compare the data of the feature files by node, skipping files with the same
+    # content hash. Both files are streamed in node order and merged on their keys,
+    # so a value added for one node counts as one added item, whatever its position.
+    # Returns the numbers of changed, added and removed items (node values, edges,
+    # or otext settings), and the first limit differences as (key, old, new).
+    isOtext = f == 'otext'
+    result = dict(feature=f, equal=True, changed=0, added=0, removed=0, samples=[])
+    if contentHash(existingPath, isOtext) == contentHash(newPath, isOtext):
+        return result
+    items = configItems if isOtext else featureItems
+    for (key, e, n) in mergeItems(items(existingPath), items(newPath)):
+        if e == None: result['added'] += 1
+        elif n == None: result['removed'] += 1
+        else: result['changed'] += 1
+        if len(result['samples']) < limit:
+            e = '<empty>' if e == None else e
+            n = '<empty>' if n == None else n
+            shortE = e[0:cutOff] + (' ...' if len(e) > cutOff else '')
+            shortN = n[0:cutOff] + (' ...' if len(n) > cutOff else '')
+            key = '{}->{}'.format(*key) if type(key) == tuple else key
+            result['samples'].append((key, shortE, shortN))
+    result['equal'] = not (result['changed'] or result['added'] or result['removed'])
+    return result
+
+def checkDiffs(thisSave, thisDeliver, only=None, sample=True, processes=1):
+    def showFeature(r):
+        f = r['feature']
+        caption(0, '{:<25} ... '.format(f), newLine=False)
+        if r['equal']:
+            caption(0, 'no changes', continuation=True)
+            return
+        caption(0, 'differences{}'.format('' if f == 'otext' else ' after the metadata'), continuation=True)
+        if sample:
+            for (key, shortE, shortN) in r['samples']:
+                caption(0, '\t{:>15} OLD -->{}<--'.format(key, shortE))
+                caption(0, '\t{:>15} NEW -->{}<--'.format(key, shortN))
+        caption(0, '\t{} changed, {} added, {} removed'.format(r['changed'], r['added'], r['removed']))
+
+    caption(4, 'Check differences with previous version')
+    existingFiles = glob('{}/*.tf'.format(thisDeliver))
+    newFiles = glob('{}/*.tf'.format(thisSave))
+    existingFeatures = {os.path.basename(os.path.splitext(f)[0]) for f in existingFiles}
+    newFeatures = {os.path.basename(os.path.splitext(f)[0]) for f in newFiles}
+
+    if only != None:
+        existingFeatures &= only
+        newFeatures &= only
+
+    addedOnes = newFeatures - existingFeatures
+    deletedOnes = existingFeatures - newFeatures
+    commonOnes = newFeatures & existingFeatures
+
+    if addedOnes:
+        caption(0, '\t{} features to add'.format(len(addedOnes)))
+        for f in sorted(addedOnes): caption(0, '\t\t{}'.format(f))
+    else:
+        caption(0, '\tno features to add')
+    if deletedOnes:
+        caption(0, '\t{} features to delete'.format(len(deletedOnes)))
+        for f in sorted(deletedOnes): caption(0, '\t\t{}'.format(f))
+    else:
+        caption(0, '\tno features to delete')
+
+    caption(0, '\t{} features in common'.format(len(commonOnes)))
+    features = sorted(commonOnes)
+    args = (
+        features,
+        ['{}/{}.tf'.format(thisDeliver, f) for f in features],
+        ['{}/{}.tf'.format(thisSave, f) for f in features],
+    )
+    if processes > 1 and len(features) > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(diffFeature, *args))
+    else:
+        results = list(map(diffFeature, *args))
+    for r in results: showFeature(r)
+    caption(0, 'Done')
+    return dict(
+        added=sorted(addedOnes),
+        deleted=sorted(deletedOnes),
+        common={r['feature']: r for r in results},
+    )
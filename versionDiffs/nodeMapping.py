@@ -0,0 +1,140 @@
+'''
+Array-backed node mappings between versions of a TF dataset.
+
+A NodeMap holds an omap@v-w edge feature in CSR form:
+the source nodes that have counterparts, and per source
+a slice of target nodes with their dissimilarities.
+The best match of every source is the counterpart with
+the lowest (dissimilarity, node), as composeMap in
+versionPhrases.ipynb picks it. Composing maps over several
+versions, the dissimilarity statistics, and the feature
+change counts are array operations on these vectors.
+
+A missing dissimilarity (None) counts as 0, as in showStats.
+'''
+
+import collections
+import numpy as np
+
+class NodeMap(object):
+
+    def __init__(self, sources, indptr, targets, dissims):
+        self.sources = np.asarray(sources, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        self.dissims = np.asarray(dissims, dtype=np.int64)
+
+        # node -> row, -1 if the node has no counterparts
+        size = self.sources.max() + 1 if self.sources.size else 0
+        self.rows = np.full(size, -1, dtype=np.int64)
+        self.rows[self.sources] = np.arange(self.sources.size)
+
+        # best match per row: lowest (dissimilarity, target) within the row
+        rowIds = np.repeat(np.arange(self.sources.size), np.diff(self.indptr))
+        # sorting by row first keeps every row at its own slice of order
+        order = np.lexsort((self.targets, self.dissims, rowIds))
+        hasEdges = np.diff(self.indptr) > 0
+        first = order[self.indptr[:-1][hasEdges]]
+        self.best = np.zeros(self.sources.size, dtype=np.int64)
+        self.bestDissim = np.zeros(self.sources.size, dtype=np.int64)
+        self.best[hasEdges] = self.targets[first]
+        self.bestDissim[hasEdges] = self.dissims[first]
+
+    @classmethod
+    def fromDict(cls, mapping):
+        # mapping: {node: [(node, dissimilarity), ...]}, like phraseMapping[(v, w)]
+        sources = np.array(sorted(mapping), dtype=np.int64)
+        lengths = np.fromiter((len(mapping[n]) for n in sources), dtype=np.int64, count=sources.size)
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        targets = np.fromiter((m for n in sources for (m, dis) in mapping[n]), dtype=np.int64, count=indptr[-1])
+        dissims = np.fromiter((dis or 0 for n in sources for (m, dis) in mapping[n]), dtype=np.int64, count=indptr[-1])
+        return cls(sources, indptr, targets, dissims)
+
+    @classmethod
+    def fromEdge(cls, V, W, mapVW, otype='phrase'):
+        # read edge feature mapVW of version W for the otype nodes of version V
+        edges = W.Es(mapVW)
+        mapping = {}
+        for n in V.F.otype.s(otype):
+            ms = edges.f(n)
+            if ms != None: mapping[n] = ms
+        return cls.fromDict(mapping)
+
+    def __len__(self):
+        return self.sources.size
+
+    def rowOf(self, nodes):
+        nodes = np.asarray(nodes, dtype=np.int64)
+        inRange = (nodes >= 0) & (nodes < self.rows.size)
+        return np.where(inRange, self.rows[np.where(inRange, nodes, 0)], -1)
+
+    def bestOf(self, nodes):
+        # best counterpart of nodes, 0 where there is none
+        rows = self.rowOf(nodes)
+        return np.where(rows >= 0, self.best[np.maximum(rows, 0)], 0)
+
+    def edges(self):
+        # (source, target, dissimilarity) of every edge as parallel arrays
+        return (np.repeat(self.sources, np.diff(self.indptr)), self.targets, self.dissims)
+
+    def compose(self, other):
+        # Follow the best match of every source into the next map and take
+        # its counterparts there. Sources whose best match has no counterpart
+        # in other are dropped.
+        rows = other.rowOf(self.best)
+        keep = rows >= 0
+        rows = rows[keep]
+        starts = other.indptr[rows]
+        lengths = other.indptr[rows + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        gather = np.repeat(starts - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return NodeMap(self.sources[keep], indptr, other.targets[gather], other.dissims[gather])
+
+    def toDict(self):
+        return {
+            int(n): [(int(m), int(d)) for (m, d) in zip(self.targets[a:b], self.dissims[a:b])]
+            for (n, a, b) in zip(self.sources, self.indptr[:-1], self.indptr[1:])
+        }
+
+    def stats(self):
+        # number of distinct targets per dissimilarity, indexed by dissimilarity
+        if not self.targets.size: return np.zeros(1, dtype=np.int64)
+        pairs = np.unique(np.stack((self.dissims, self.targets)), axis=1)
+        return np.bincount(pairs[0])
+
+    def statsTable(self):
+        stats = self.stats()
+        table = [['dissimilarity', 'number of phrases']]
+        for (dis, n) in enumerate(stats):
+            table.append([dis, n if n else ''])
+        return table
+
+    def featureCounts(self, vValue, wValue):
+        # {source value: Counter({target value: edges})}, with vValue and wValue
+        # looking up a node's value in the source and target version.
+        # Values are looked up once per distinct node.
+        (sources, targets, dissims) = self.edges()
+        uSources, sourceIndex = np.unique(sources, return_inverse=True)
+        uTargets, targetIndex = np.unique(targets, return_inverse=True)
+        vCodes = {}
+        wCodes = {}
+        vOfSource = np.fromiter((vCodes.setdefault(vValue(int(n)), len(vCodes)) for n in uSources),
+                                dtype=np.int64, count=uSources.size)
+        wOfTarget = np.fromiter((wCodes.setdefault(wValue(int(m)), len(wCodes)) for m in uTargets),
+                                dtype=np.int64, count=uTargets.size)
+        nW = max(len(wCodes), 1)
+        counts = np.bincount(vOfSource[sourceIndex] * nW + wOfTarget[targetIndex],
+                             minlength=len(vCodes) * nW).reshape(len(vCodes), nW)
+        vValues = list(vCodes)
+        wValues = list(wCodes)
+        combis = {}
+        for (i, j) in zip(*np.nonzero(counts)):
+            combis.setdefault(vValues[i], collections.Counter())[wValues[j]] = int(counts[i, j])
+        return combis
+
+def composeAll(maps):
+    # compose a sequence of NodeMaps, e.g. 3 -> 4 -> 4b -> 2016 -> 2017
+    result = maps[0]
+    for nodeMap in maps[1:]:
+        result = result.compose(nodeMap)
+    return result
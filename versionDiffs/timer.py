@@ -0,0 +1,174 @@
+'''
+Structured timing spans for pipeline runs, as a
+successor of the timestamps of caption in utils.
+
+A Timer records nested spans with their durations and
+counts, and exports them as data (JSON) or as a Chrome
+trace. Spans of disabled levels cost almost nothing.
+caption's console output is one renderer of the spans,
+captionRenderer.
+'''
+
+import os, time, json, threading
+from utils import caption
+
+def formatInterval(interval):
+    # as the durations of caption
+    if interval < 10: return "{: 2.2f}s".format(interval)
+    interval = int(round(interval))
+    if interval < 60: return "{:>2d}s".format(interval)
+    if interval < 3600: return "{:>2d}m {:>02d}s".format(interval // 60, interval % 60)
+    return "{:>2d}h {:>02d}m {:>02d}s".format(interval // 3600, (interval % 3600) // 60, interval % 60)
+
+class Span(object):
+    # A timed phase: name, caption level, start and end (perf_counter seconds),
+    # nested spans, counts added while it is open, and the thread it ran in.
+    __slots__ = ('timer', 'name', 'level', 'start', 'end', 'children', 'counts', 'thread')
+
+    def __init__(self, timer, name, level):
+        self.timer = timer
+        self.name = name
+        self.level = level
+        self.start = None
+        self.end = None
+        self.children = []
+        self.counts = {}
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        self.timer._open(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._close(self)
+        return False
+
+    @property
+    def duration(self):
+        return (self.end if self.end != None else time.perf_counter()) - self.start
+
+    def count(self, key, n=1):
+        self.counts[key] = self.counts.get(key, 0) + n
+
+class _NoSpan(object):
+    # Stands in for the spans of disabled levels: one per timer, no timing.
+    # It is put on the span stack, so that counts inside it are dropped
+    # instead of landing on an enclosing span.
+    __slots__ = ('timer',)
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.timer._stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._local.stack.pop()
+        return False
+
+    def count(self, key, n=1): pass
+
+def captionRenderer(event, span):
+    if event == 'start':
+        caption(span.level, span.name)
+    else:
+        caption(span.level, '{} done in {}'.format(span.name, formatInterval(span.duration).strip()))
+
+class Timer(object):
+    # Records nested spans:
+    #     with timer.span('load', level=3): ...
+    #     @timer.timed(level=0)
+    # Spans of levels not in levels are not recorded and cost one set lookup
+    # and a push on the span stack. Counts inside them are dropped.
+    # render(event, span) is called when a span starts and ends,
+    # e.g. captionRenderer; the spans can be exported as JSON or Chrome trace.
+
+    def __init__(self, levels=(0, 1, 2, 3, 4), render=None):
+        self.levels = frozenset(levels)
+        self.render = render
+        self.roots = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._noSpan = _NoSpan(self)
+
+    def span(self, name, level=0):
+        if level not in self.levels: return self._noSpan
+        return Span(self, name, level)
+
+    def timed(self, name=None, level=0):
+        def decorator(function):
+            spanName = name or function.__name__
+            def wrapper(*args, **kwargs):
+                with self.span(spanName, level):
+                    return function(*args, **kwargs)
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            return wrapper
+        return decorator
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack == None: stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        # the innermost open span, or the no-op span if that is disabled
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else self._noSpan
+
+    def count(self, key, n=1):
+        self.current().count(key, n)
+
+    def _open(self, span):
+        stack = self._stack()
+        # spans inside disabled spans nest in the nearest recorded span
+        parent = next((s for s in reversed(stack) if s is not self._noSpan), None)
+        if parent != None: parent.children.append(span)
+        else:
+            with self._lock: self.roots.append(span)
+        stack.append(span)
+        if self.render != None: self.render('start', span)
+        span.start = time.perf_counter()
+
+    def _close(self, span):
+        span.end = time.perf_counter()
+        self._local.stack.pop()
+        if self.render != None: self.render('end', span)
+
+    def _tree(self, span):
+        return dict(
+            name=span.name,
+            level=span.level,
+            start=round(span.start - self.origin, 6),
+            duration=round(span.duration, 6),
+            counts=dict(span.counts),
+            children=[self._tree(c) for c in span.children],
+        )
+
+    def asData(self):
+        return [self._tree(s) for s in self.roots]
+
+    def chromeTrace(self):
+        events = []
+        stack = list(self.roots)
+        while stack:
+            span = stack.pop()
+            events.append(dict(
+                name=span.name,
+                cat='level{}'.format(span.level),
+                ph='X',
+                ts=round((span.start - self.origin) * 1e6, 3),
+                dur=round(span.duration * 1e6, 3),
+                pid=os.getpid(),
+                tid=span.thread,
+                args=dict(span.counts),
+            ))
+            stack.extend(span.children)
+        events.sort(key=lambda e: e['ts'])
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def save(self, path, chrome=False):
+        with open(path, 'w') as h:
+            json.dump(self.chromeTrace() if chrome else self.asData(), h, indent=1)
@@ -0,0 +1,136 @@
+'''
+Micro-benchmark of Getter and Positions: memory per
+instance and lookups per second, compared with the
+unslotted, exception-based versions they replaced.
+Run as a script to benchmark on the BHSA, or call
+benchmark with a loaded TF app.
+'''
+
+import sys
+import time
+import tracemalloc
+from positions import Getter, Positions, PositionIndex
+
+class DictGetter:
+    '''
+    Getter before __slots__ and bounds checks.
+    '''
+    def __init__(self, iterable, default=None):
+        self.iterable = iterable
+        self.default = default
+    def __iter__(self):
+        for i in self.iterable:
+            yield i
+    def __getitem__(self, key):
+        try:
+            return self.iterable[key]
+        except IndexError:
+            return self.default
+
+class DictPositions:
+    '''
+    Positions before __slots__ and the PositionIndex:
+    every lookup traverses L.d and searches the context
+    with list.index, through a new DictGetter.
+    '''
+    def __init__(self, n, context, tf=None):
+        self.tf = tf.api
+        self.n = n
+        self.thisotype = tf.api.F.otype.v(n)
+        self.context = (context if type(context) != str 
+                            else self.get_context(context))
+    def get(self, position, features=None):
+        L, Fs = self.tf.L, self.tf.Fs # TF classes
+        positions = L.d(self.context, self.thisotype)
+        origin = positions.index(self.n)
+        target = origin + position
+        get_pos = DictGetter(positions)[target]
+        
+        # return None, empty string, or empty set if beyond boundaries
+        if not get_pos:
+            if not features:
+                return None
+            elif len(features.split())==1:
+                return ''
+            else:
+                return set()
+        
+        # simple node return
+        if not features:
+            return get_pos
+        
+        # give single feature
+        if len(features.split())==1:
+            return Fs(features).v(get_pos)
+        
+        # give pl features
+        elif features:
+            feats = set()
+            for f in features.split():
+                feats.add(Fs(f).v(get_pos))
+            return feats
+    def get_context(self, otype):
+        return DictGetter(self.tf.L.u(self.n, otype))[0]
+
+def instance_bytes(make, n):
+    '''
+    Return the mean bytes allocated per instance
+    when n instances are made and kept alive.
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = [make(i) for i in range(n)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del keep
+    return size / n
+
+def lookups_per_sec(lookup, keys, repeat=3):
+    '''
+    Return the best rate of lookup over keys.
+    '''
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        for key in keys:
+            lookup(key)
+        best = min(best, time.perf_counter() - start)
+    return len(keys) / best
+
+def benchmark(tf, context='sentence', otype='word', limit=100000):
+    '''
+    Compare the slotted Getter and indexed Positions
+    with the versions they replaced on up to limit
+    nodes. Returns a dict of {name: (old, new)}
+    measurements.
+    '''
+    index = PositionIndex.cached(tf, context, otype)
+    nodes = [int(n) for n in index.nodes[:limit]]
+    items = list(range(10))
+    keys = [i % 25 - 5 for i in range(len(nodes))] # half out of range
+
+    results = {}
+    results['Getter bytes'] = (instance_bytes(lambda i: DictGetter(items), len(nodes)),
+                               instance_bytes(lambda i: Getter(items), len(nodes)))
+    old, new = DictGetter(items), Getter(items)
+    results['Getter lookups/s'] = (lookups_per_sec(old.__getitem__, keys),
+                                   lookups_per_sec(new.__getitem__, keys))
+    results['Positions bytes'] = (
+        instance_bytes(lambda i: DictPositions(nodes[i], context, tf), len(nodes)),
+        instance_bytes(lambda i: Positions(nodes[i], context, index=index), len(nodes)),
+    )
+    old = [DictPositions(n, context, tf) for n in nodes]
+    new = [Positions(n, context, index=index) for n in nodes]
+    results['Positions lookups/s'] = (lookups_per_sec(lambda p: p.get(1), old),
+                                      lookups_per_sec(lambda p: p.get(1), new))
+    return results
+
+def report(results):
+    for name, (old, new) in results.items():
+        print(f'{name:<22} {old:>14,.1f} -> {new:>14,.1f} ({new/old:.2f}x)')
+
+if __name__ == '__main__':
+    from tf.app import use
+    A = use('bhsa', silent=True)
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    report(benchmark(A, limit=limit))
@@ -0,0 +1,196 @@
+'''
+The CooccurrenceCounter class counts target * colexeme
+co-occurrences in compact NumPy buffers, as a replacement
+for a defaultdict(Counter) that is converted to a DataFrame.
+Labels are interned to integer ids by the Labels class.
+'''
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+class Labels:
+    '''
+    Interns hashable labels to consecutive integer ids.
+    Ids are given in order of first appearance.
+    '''
+
+    def __init__(self, labels=()):
+        self.ids = {}
+        self.labels = []
+        for label in labels:
+            self.id(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def id(self, label):
+        '''
+        Return the id of a label, adding it if new.
+        '''
+        i = self.ids.get(label)
+        if i is None:
+            i = self.ids[label] = len(self.labels)
+            self.labels.append(label)
+        return i
+
+    def to_ids(self, labels):
+        '''
+        Return an array of ids for an iterable of labels.
+        '''
+        return np.fromiter((self.id(l) for l in labels), dtype=np.int64)
+
+class CooccurrenceCounter:
+    '''
+    Accumulates co-occurrence counts between targets
+    and colexemes (context features) as COO triples
+    of (target id, colexeme id, count) in growable arrays.
+    Duplicate triples are summed whenever the buffers fill up,
+    so memory stays close to the number of distinct pairs.
+    Counters built over different corpus slices can be merged.
+
+    significance.apply_fishers accepts a counter in place of a
+    DataFrame: it uses the counter's margins as they are and
+    scores its CSR matrix one block of rows at a time, without
+    building the full dense table or a DataFrame of the counts.
+    '''
+
+    def __init__(self, capacity=1024):
+        self.targets = Labels()
+        self.colexes = Labels()
+        self._target_ids = np.empty(capacity, dtype=np.int64)
+        self._colex_ids = np.empty(capacity, dtype=np.int64)
+        self._counts = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+
+    def __len__(self):
+        '''
+        Number of distinct (target, colexeme) pairs.
+        '''
+        self.compact()
+        return self._size
+
+    @property
+    def shape(self):
+        return (len(self.colexes), len(self.targets))
+
+    def _reserve(self, n):
+        '''
+        Make room for n more triples: compact first, grow if still needed.
+        '''
+        if self._size + n <= self._counts.size:
+            return
+        self.compact()
+        needed = self._size + n
+        if needed * 2 > self._counts.size:
+            capacity = max(needed * 2, self._counts.size * 2)
+            for name in ('_target_ids', '_colex_ids', '_counts'):
+                grown = np.empty(capacity, dtype=np.int64)
+                grown[:self._size] = getattr(self, name)[:self._size]
+                setattr(self, name, grown)
+
+    def add_ids(self, target_ids, colex_ids, counts=1):
+        '''
+        Add counts for arrays of already interned ids.
+        '''
+        target_ids, colex_ids, counts = np.broadcast_arrays(
+            np.asarray(target_ids, dtype=np.int64),
+            np.asarray(colex_ids, dtype=np.int64),
+            np.asarray(counts, dtype=np.int64),
+        )
+        n = target_ids.size
+        self._reserve(n)
+        end = self._size + n
+        self._target_ids[self._size:end] = target_ids.ravel()
+        self._colex_ids[self._size:end] = colex_ids.ravel()
+        self._counts[self._size:end] = counts.ravel()
+        self._size = end
+
+    def add(self, targets, colexes, counts=1):
+        '''
+        Add counts for parallel iterables of target and colexeme labels.
+        '''
+        self.add_ids(self.targets.to_ids(targets),
+                     self.colexes.to_ids(colexes),
+                     counts)
+
+    def update(self, target, colexes):
+        '''
+        Count every colexeme once for a target.
+        Same as Counter.update on wordcons[target].
+        '''
+        colex_ids = self.colexes.to_ids(colexes)
+        self.add_ids(self.targets.id(target), colex_ids)
+
+    def merge(self, other):
+        '''
+        Add the counts of another counter into this one.
+        The other counter's labels are mapped onto this one's ids.
+        '''
+        target_map = self.targets.to_ids(other.targets)
+        colex_map = self.colexes.to_ids(other.colexes)
+        target_ids, colex_ids, counts = other.triples()
+        self.add_ids(target_map[target_ids], colex_map[colex_ids], counts)
+        return self
+
+    def compact(self):
+        '''
+        Sum duplicate (target, colexeme) triples in place.
+        '''
+        if not self._size:
+            return
+        size = self._size
+        key = (self._target_ids[:size] * max(len(self.colexes), 1)
+                   + self._colex_ids[:size])
+        key, inverse = np.unique(key, return_inverse=True)
+        counts = np.bincount(inverse, weights=self._counts[:size]).astype(np.int64)
+        n = key.size
+        self._target_ids[:n], self._colex_ids[:n] = np.divmod(key, max(len(self.colexes), 1))
+        self._counts[:n] = counts
+        self._size = n
+
+    def triples(self):
+        '''
+        Return compacted (target ids, colexeme ids, counts) arrays.
+        '''
+        self.compact()
+        size = self._size
+        return (self._target_ids[:size], self._colex_ids[:size], self._counts[:size])
+
+    def margins(self):
+        '''
+        Return target sums, colexeme sums, and the total as arrays.
+        '''
+        target_ids, colex_ids, counts = self.triples()
+        target_obs = np.bincount(target_ids, weights=counts, minlength=len(self.targets))
+        colex_obs = np.bincount(colex_ids, weights=counts, minlength=len(self.colexes))
+        return (target_obs, colex_obs, counts.sum())
+
+    def tocsr(self):
+        '''
+        Return counts as a sparse colexeme * target matrix.
+        '''
+        target_ids, colex_ids, counts = self.triples()
+        return sp.csr_matrix((counts, (colex_ids, target_ids)), shape=self.shape)
+
+    def toarray(self):
+        '''
+        Return counts as a dense colexeme * target array.
+        '''
+        target_ids, colex_ids, counts = self.triples()
+        dense = np.zeros(self.shape, dtype=np.int64)
+        dense[colex_ids, target_ids] = counts
+        return dense
+
+    def to_frame(self):
+        '''
+        Return counts as a DataFrame shaped like
+        pd.DataFrame(wordcons).fillna(0): colexemes in
+        the index and targets in the columns.
+        '''
+        return pd.DataFrame(self.toarray(),
+                            index=list(self.colexes),
+                            columns=list(self.targets))
@@ -3,28 +3,40 @@ The Getter class provides list-like interactions
 with safe-indexing for indices lying beyond the list's limits.
 The Positions class delivers positional
 data on demand when instanced on a TF node.
+The PositionIndex class precomputes positions of all
+nodes of a type within their contexts, for fast lookups.
 '''
 
+import numpy as np
+from itertools import chain
+from shared import load_tools
+
+FeatureColumns = load_tools('features').FeatureColumns
+
 class Getter:
     '''
     A class to safely index beyond the limits of
     an iterable with a default returned.
     Like dict.get but for iterables.
+    Indices are bounds-checked rather than caught.
     '''
     
+    __slots__ = ('iterable', 'default')
+    
     def __init__(self, iterable, default=None):
         self.iterable = iterable
         self.default = default
         
     def __iter__(self):
-        for i in self.iterable:
-            yield i
+        return iter(self.iterable)
         
     def __getitem__(self, key):
-        try:
+        if type(key) == slice:
             return self.iterable[key]
-        except IndexError:
-            return self.default
+        size = len(self.iterable)
+        if -size <= key < size:
+            return self.iterable[key]
+        return self.default
         
     def index(self, i):
         try:
@@ -32,6 +44,116 @@ class Getter:
         except ValueError:
             return self.default
 
+class PositionIndex:
+    '''
+    Precomputed positions of all nodes of one otype
+    within the nodes of a larger context otype.
+    Built once per (context, otype) pair, it maps
+    every node to its context and its offset there,
+    stored as NumPy arrays, so that looking up a node
+    (+/-)N positions away is a few array reads.
+    A node in several contexts is assigned to the first.
+    Use PositionIndex.cached to share indexes.
+    '''
+    
+    _cache = {}
+    
+    def __init__(self, tf, context, otype):
+        api = tf.api
+        if api.otypeRank[otype] > api.otypeRank[context]:
+            raise Exception('Provided context is smaller than the provided node!')
+        self.api = api
+        self.context_otype = context
+        self.otype = otype
+        
+        # nodes of all contexts, laid out one context after the other
+        contexts = list(api.F.otype.s(context))
+        members = [api.L.d(c, otype) for c in contexts]
+        lengths = np.array([len(m) for m in members], dtype=np.int64)
+        self.contexts = np.array(contexts, dtype=np.int64)
+        self.nodes = np.fromiter(chain.from_iterable(members), 
+                                 dtype=np.int64, count=lengths.sum())
+        self.context_ids = np.repeat(np.arange(len(contexts)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        self.offsets = np.arange(self.nodes.size) - np.repeat(starts, lengths)
+        
+        # node -> position in the layout, -1 if in no context
+        self.base = self.nodes.min() if self.nodes.size else 0
+        size = self.nodes.max() - self.base + 1 if self.nodes.size else 0
+        self.lookup = np.full(size, -1, dtype=np.int64)
+        nodes, first = np.unique(self.nodes, return_index=True)
+        self.lookup[nodes - self.base] = first
+        
+    @classmethod
+    def cached(cls, tf, context, otype):
+        '''
+        Return a shared index, building it on first use.
+        '''
+        key = (id(tf.api), context, otype)
+        if key not in cls._cache:
+            cls._cache[key] = cls(tf, context, otype)
+        return cls._cache[key]
+    
+    def position(self, n):
+        '''
+        Return a node's place in the layout, or -1.
+        '''
+        i = n - self.base
+        return self.lookup[i] if 0 <= i < self.lookup.size else -1
+    
+    def context(self, n):
+        '''
+        Return the context node of a node, or None.
+        '''
+        i = self.position(n)
+        return int(self.contexts[self.context_ids[i]]) if i >= 0 else None
+    
+    def offset(self, n):
+        '''
+        Return a node's offset within its context, or None.
+        '''
+        i = self.position(n)
+        return int(self.offsets[i]) if i >= 0 else None
+    
+    def get(self, n, position):
+        '''
+        Return the node (+/-)N positions away within
+        the same context, or None beyond its boundaries.
+        '''
+        i = self.position(n)
+        j = i + position
+        if i < 0 or not 0 <= j < self.nodes.size:
+            return None
+        if self.context_ids[j] != self.context_ids[i]:
+            return None
+        return int(self.nodes[j])
+    
+    def window(self, nodes, offsets):
+        '''
+        Return layout positions of the nodes at the given
+        offsets from each node, as a 2-D array (nodes * offsets),
+        and a mask that is False beyond the context boundaries.
+        '''
+        nodes = np.asarray(nodes, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        i = np.full(nodes.shape, -1, dtype=np.int64)
+        inside = (nodes >= self.base) & (nodes - self.base < self.lookup.size)
+        i[inside] = self.lookup[nodes[inside] - self.base]
+        j = i[:, None] + offsets[None, :]
+        mask = (i[:, None] >= 0) & (j >= 0) & (j < self.nodes.size)
+        mask[mask] = (self.context_ids[j[mask]] 
+                          == self.context_ids[np.broadcast_to(i[:, None], j.shape)[mask]])
+        return np.where(mask, j, -1), mask
+    
+    def shift(self, nodes, position):
+        '''
+        Vectorized get: return an array with the node
+        (+/-)N positions away for each node, and 0
+        where that lies beyond the context.
+        '''
+        j, mask = self.window(np.ravel(nodes), [position])
+        return np.where(mask, self.nodes[j], 0).reshape(np.shape(nodes))
+
 class Positions:
     '''
     For a given node, provides access to nodes
@@ -39,25 +161,49 @@ class Positions:
     node adjacency within a given context.
     The context must be a nodeType that is larger
     than the supplied node.
+    With a PositionIndex for the same context type,
+    creation and lookups need no TF traversals, and
+    all instances share the index as their context table;
+    a context other than the index's raises an Exception.
+    Instances are slotted, since one is made per word.
+    Feature values are read from the corpus's shared
+    FeatureColumns, each loaded once on first use.
     '''
     
-    def __init__(self, n, context, tf=None):
-        self.tf = tf.api # make TF classes avail
+    __slots__ = ('tf', 'n', 'index', 'thisotype', 'context')
+    
+    def __init__(self, n, context, tf=None, index=None):
+        self.tf = tf.api if tf is not None else index.api # make TF classes avail
         self.n = n
-        self.thisotype = tf.api.F.otype.v(n)
-        self.context = (context if type(context) != str 
-                            else self.get_context(context))
+        self.index = index
+        if index is not None:
+            self.thisotype = index.otype
+            # the index only knows the context it was built for
+            if type(context) == str and context != index.context_otype:
+                raise Exception('Provided context is not the context of the index!')
+            self.context = index.context(n)
+            if type(context) != str and context != self.context:
+                raise Exception('Provided context node is not the indexed context of the node!')
+        else:
+            self.thisotype = self.tf.F.otype.v(n)
+            self.context = (context if type(context) != str 
+                                else self.get_context(context))
     
     def get(self, position, features=None):
         '''
         Get a node (+/-)N positions away, 
         with an option to get values for specified features.
         '''
-        L, Fs = self.tf.L, self.tf.Fs # TF classes
-        positions = L.d(self.context, self.thisotype)
-        origin = positions.index(self.n)
-        target = origin + position
-        get_pos = Getter(positions)[target]
+        Fs = FeatureColumns.cached(self.tf).Fs # feature columns
+        if self.index is not None:
+            get_pos = self.index.get(self.n, position)
+        else:
+            L = self.tf.L
+            positions = L.d(self.context, self.thisotype)
+            origin = positions.index(self.n)
+            target = origin + position
+            # negative targets would wrap around to the context's end
+            get_pos = positions[target] if 0 <= target < len(positions) else None
         
         # return None, empty string, or empty set if beyond boundaries
         if not get_pos:
@@ -101,13 +247,92 @@ class Evaluator:
     Allows string conditionals to be fed in for 
     evaluation. Can also construct a dict mapping from
     string to its evaluation.
+    Condition strings are compiled once and the code
+    objects shared by all Evaluators. Batch methods
+    evaluate conditions over many (node, namespace)
+    candidates. Candidate namespaces are merged into
+    the globals of the evaluation, so that their names
+    are also seen inside comprehensions and lambdas;
+    a batch copies the Evaluator's namespace once.
     '''
+    
+    _compiled = {}
+    
     def __init__(self, namespace):
         self.namespace = namespace
-    def evaluate(self, cond):
-        return eval(cond, self.namespace)
-    def conddict(self, *conds):
-        return {cond:eval(cond, self.namespace) for cond in conds}
+        
+    @classmethod
+    def compile(cls, cond):
+        '''
+        Return the cached code object of a condition.
+        '''
+        code = cls._compiled.get(cond)
+        if code is None:
+            code = cls._compiled[cond] = compile(cond, '<condition>', 'eval')
+        return code
+    
+    def scope(self, namespace=None):
+        '''
+        Return the globals to evaluate in: the Evaluator's
+        namespace, merged with namespace if given.
+        '''
+        if namespace is None:
+            return self.namespace
+        return {**self.namespace, **namespace}
+    
+    def scopes(self, candidates):
+        '''
+        Yield (node, globals) for each (node, namespace)
+        candidate. One copy of the Evaluator's namespace
+        is updated per candidate, and the names a candidate
+        set are restored before the next one.
+        '''
+        base = self.namespace
+        scope = dict(base)
+        for node, namespace in candidates:
+            scope.update(namespace)
+            yield node, scope
+            for name in namespace:
+                if name in base:
+                    scope[name] = base[name]
+                else:
+                    del scope[name]
+    
+    def evaluate(self, cond, namespace=None):
+        return eval(self.compile(cond), self.scope(namespace))
+    
+    def conddict(self, *conds, namespace=None):
+        scope = self.scope(namespace)
+        return {cond:eval(self.compile(cond), scope) for cond in conds}
+    
+    def check(self, *conds, namespace=None):
+        '''
+        Return whether all conditions are True,
+        stopping at the first that is not.
+        '''
+        scope = self.scope(namespace)
+        return all(eval(self.compile(cond), scope) for cond in conds)
+    
+    def batch(self, candidates, *conds):
+        '''
+        Yield (node, conddict) for each (node, namespace)
+        candidate, as getnext and showconds take them.
+        '''
+        codes = [(cond, self.compile(cond)) for cond in conds]
+        for node, scope in self.scopes(candidates):
+            yield node, {cond:eval(code, scope) for cond, code in codes}
+    
+    def first(self, candidates, *conds):
+        '''
+        Return the first candidate node whose conditions
+        all pass, evaluating no further, or None.
+        '''
+        codes = [self.compile(cond) for cond in conds]
+        for node, scope in self.scopes(candidates):
+            if all(eval(code, scope) for code in codes):
+                return node
+        return None
+    
     def update(self, namespace):
         self.namespace.update(namespace)
     
@@ -115,9 +340,14 @@ def getnext(ctuple):
     '''
     Returns first valid node from a {node:{string:boolean}} dict
     where all booleans must == True.
+    ctuple can be a generator such as Evaluator.batch,
+    in which case no candidates past the first valid one
+    are evaluated.
     '''
-    results = [pos for pos, conds in ctuple if all(conds.values())]
-    return Getter(results)[0]
+    for pos, conds in ctuple:
+        if all(conds.values()):
+            return pos
+    return None
     
 def showconds(conddict):
     '''
@@ -126,4 +356,4 @@ def showconds(conddict):
     for node, conds in conddict:
         print('node', node)
         for cond, truth in conds.items():
-            print('\t{:<25} {:>25}'.format(cond, str(truth)))
\ No newline at end of file
+            print('\t{:<25} {:>25}'.format(cond, str(truth)))
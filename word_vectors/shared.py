@@ -0,0 +1,27 @@
+'''
+The load_tools function loads modules of the repo's
+tools folder, which are shared with other projects.
+Their names (features, significance) clash with
+modules here, so they are loaded by path as
+tools_<name>, without changing sys.path.
+'''
+
+import importlib.util
+import os
+import sys
+
+def load_tools(name):
+    '''
+    Return tools/<name>.py as the module tools_<name>,
+    loading it on first use.
+    '''
+    module_name = 'tools_' + name
+    module = sys.modules.get(module_name)
+    if module is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            os.pardir, 'tools', name + '.py')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return module
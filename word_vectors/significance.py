@@ -2,14 +2,49 @@
 This module contains scripts for testing statistical associations.
 '''
 
-import collections
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
-from datetime import datetime
+import scipy.sparse as sp
+from shared import load_tools
 
 np.seterr(divide='ignore')
 
+# the vectorized Fisher's exact test and the RunReport
+# progress instrumentation of tools/significance
+tools_significance = load_tools('significance')
+hypergeom_logpmf = tools_significance.hypergeom_logpmf
+RunReport = tools_significance.RunReport
+print_progress = tools_significance.print_progress
+
+def margins(df):
+    '''
+    Return the counts of a co-occurrence table, its colex
+    (row) and target (column) labels, its target sums,
+    colex sums, and total. The table may be a DataFrame,
+    whose values are the counts, or a CooccurrenceCounter,
+    whose counts are its sparse colex * target matrix
+    and whose margins are used as they are.
+    '''
+    if isinstance(df, pd.DataFrame):
+        a = df.values
+        target_obs = a.sum(axis=0) # column sums
+        colex_obs = a.sum(axis=1) # row sums
+        total_obs = target_obs.sum() # total observations
+        return a, df.index, df.columns, target_obs, colex_obs, total_obs
+    # a CooccurrenceCounter
+    target_obs, colex_obs, total_obs = df.margins()
+    return df.tocsr(), list(df.colexes), list(df.targets), target_obs, colex_obs, total_obs
+
+def dense_rows(a, rows):
+    '''
+    Return rows of a dense or sparse count matrix
+    as a dense float array.
+    '''
+    block = a[rows]
+    if sp.issparse(block):
+        block = block.toarray()
+    return np.asarray(block, dtype=np.float64)
+
 def contingency_table(df):
     
     '''
@@ -17,20 +52,45 @@ def contingency_table(df):
     of co-occurrence data and returns the 
     data necessary for 2x2 contingency tables
     for all elements.
+    The table may also be a CooccurrenceCounter,
+    whose margins are then used as they are.
     '''
     # pre-process data for contingency tables
-    target_obs = df.apply(lambda col: col.sum(), axis=0, result_type='broadcast') # all columns filled with col sums
-    colex_obs = df.apply(lambda row: row.sum(), axis=1, result_type='broadcast') # all rows filled with row sums
-    total_obs = df.sum().sum() # total observations
-    b_matrix = target_obs.sub(df)
-    c_matrix = colex_obs.sub(df)
-    d_matrix = pd.DataFrame.copy(df, deep=True)
-    d_matrix[:] = total_obs # fill all cells with same number: the sum of all values in df
-    d_matrix = d_matrix.sub(df+b_matrix+c_matrix)
-    expected = (df+b_matrix) * (df+c_matrix) / (df+b_matrix+c_matrix+d_matrix)
-    return {'a':df, 'b':b_matrix, 'c':c_matrix, 'd':d_matrix, 'expected':expected}
+    # margins are kept as 1-D vectors and broadcast against the counts,
+    # so no full-size margin tables or copies of df are made
+    a, index, columns, target_obs, colex_obs, total_obs = margins(df)
+    if sp.issparse(a):
+        a = a.toarray()
+    target_obs = target_obs[None, :] # as a row vector
+    colex_obs = colex_obs[:, None] # as a column vector
+    b_matrix = target_obs - a
+    c_matrix = colex_obs - a
+    d_matrix = total_obs - target_obs - colex_obs + a # == total - (a+b+c)
+    expected = target_obs * colex_obs / total_obs
+    tables = {'a':a, 'b':b_matrix, 'c':c_matrix, 'd':d_matrix, 'expected':expected}
+    tables = {name:pd.DataFrame(table, index=index, columns=columns, copy=False)
+                  for name, table in tables.items()}
+    return tables
     
-def apply_fishers(df, logtransform=True):
+def score_block(a, target_obs, colex_obs, total_obs, logtransform, report):
+    '''
+    Apply Fisher's to a block of rows, given the
+    block's colex sums and the global margins.
+    '''
+    with report.phase('table'):
+        colex_obs = colex_obs[:, None]
+        b = target_obs - a
+        c = colex_obs - a
+        d = total_obs - target_obs - colex_obs + a
+    with report.phase('tests'):
+        p_values = fishers_exact(a, b, c, d)
+        if not logtransform:
+            return p_values
+        expected = target_obs * colex_obs / total_obs
+        strength = -np.log10(p_values)
+        return np.where(a < expected, -strength, strength)
+
+def apply_fishers(df, logtransform=True, block_rows=None, report=None):
     '''
     This function simply applies Fisher's
     exact test to every value in a co-occurrence
@@ -38,46 +98,98 @@ def apply_fishers(df, logtransform=True):
     Includes default option to log-transform
     the results based on log10 and expected
     frequency condition.
-    '''
+    The matrix may also be a CooccurrenceCounter,
+    whose sparse counts are made dense one block at a time.
     
-    i = 0 # counter for messages
-    start = datetime.now()
+    The matrix is scored block_rows rows at a time,
+    by default about 1,000,000 cells per block.
+    Progress and timings are recorded in report,
+    a RunReport; by default a RunReport that prints
+    progress after every block.
+    '''
+    report = RunReport(callback=print_progress) if report is None else report
+    report.start()
+    with report.phase('margins'):
+        a, index, columns, target_obs, colex_obs, total_obs = margins(df)
+    report.cells = a.shape[0] * a.shape[1]
+    block_rows = block_rows or max(1, 1000000 // max(a.shape[1], 1))
     
-    print(f'{datetime.now()-start}\t applying Fisher\'s to dataset')
+    dffishers = np.empty(a.shape)
+    for start in range(0, a.shape[0], block_rows):
+        rows = slice(start, start+block_rows)
+        with report.phase('table'):
+            block = dense_rows(a, rows)
+        dffishers[rows] = score_block(block, target_obs, colex_obs[rows],
+                                      total_obs, logtransform, report)
+        report.advance(block.size)
     
-    con = contingency_table(df)
-    b_matrix, c_matrix, d_matrix, expected = [con[x] for x in ('b', 'c', 'd', 'expected')]
-    dfsum = df.sum().sum() 
+    with report.phase('packaging'):
+        dffishers = pd.DataFrame(dffishers, index=index, columns=columns)
+    report.finish()
+    return dffishers
+
+def fishers_exact(a, b, c, d, rtol=1e-7):
+    '''
+    Two-sided Fisher's exact p-values for arrays of
+    2x2 tables [[a, b], [c, d]], all computed at once,
+    with tools/significance.fishers_exact.
+    Returns an array of p-values shaped like a.
+    '''
+    p_values, odds = tools_significance.fishers_exact(a, b, c, d, rtol=rtol)
+    return p_values
+
+def blockwise_margins(data, block_rows=1024):
+    '''
+    Compute target (column) sums, colex (row) sums,
+    and the total of a co-occurrence array by reading
+    it block_rows rows at a time.
+    '''
+    target_obs = np.zeros(data.shape[1])
+    colex_obs = np.zeros(data.shape[0])
+    for start in range(0, data.shape[0], block_rows):
+        block = np.asarray(data[start:start+block_rows], dtype=np.float64)
+        target_obs += block.sum(axis=0)
+        colex_obs[start:start+block_rows] = block.sum(axis=1)
+    return target_obs, colex_obs, colex_obs.sum()
+
+def apply_fishers_blockwise(data, outfile, logtransform=True, block_rows=1024,
+                            report=None):
+    '''
+    Applies Fisher's exact test to a co-occurrence
+    matrix that does not fit in memory, as apply_fishers
+    does for a DataFrame (colexes in rows, targets in columns).
     
-    niters = df.shape[0] * df.shape[1] # number of iterations
+    data is a path to a .npy file, which is memory-mapped,
+    or any array-like that can be sliced by rows without
+    loading the rest (np.memmap, h5py or zarr datasets).
+    The global margins are computed in a first pass; then
+    the matrix is scored block_rows rows at a time and
+    written to a memory-mapped .npy file at outfile.
+    Peak memory depends on block_rows * columns, not on
+    the size of the matrix.
+    Progress and timings are recorded in report,
+    an optional RunReport.
     
-    dffishers = collections.defaultdict(lambda: collections.defaultdict())
-    for target in df.columns:
-        for colex in df.index: 
-            # values for contingency table and expected freq.
-            a = df[target][colex]
-            b = b_matrix[target][colex]
-            c = c_matrix[target][colex]
-            d = dfsum - (a+b+c)
-            
-            # Fisher's
-            contingency = np.matrix([[a, b], [c, d]])
-            oddsratio, p_value = stats.fisher_exact(contingency)
-            
-            if not logtransform:
-                dffishers[target][colex] = p_value
-            else:
-                expected_freq = expected[target][colex]
-                if a < expected_freq:
-                    strength = np.log10(p_value)
-                else:
-                    strength = -np.log10(p_value)
-                dffishers[target][colex] = strength
-                
-            i += 1
-            if i % 1000000 == 0: # update message every 1,000,000 iterations
-                print(f'\t{datetime.now()-start}\t finished iteration {i}\t ({round((i/niters),2)*100})')
-                
-    print(f'{datetime.now()-start}\t DONE!')
-                
-    return pd.DataFrame(dffishers)
\ No newline at end of file
+    Returns the memory-mapped result array.
+    '''
+    if isinstance(data, str):
+        data = np.load(data, mmap_mode='r')
+    report = RunReport() if report is None else report
+    report.start()
+    report.cells = data.shape[0] * data.shape[1]
+    with report.phase('margins'):
+        target_obs, colex_obs, total_obs = blockwise_margins(data, block_rows)
+    result = np.lib.format.open_memmap(outfile, mode='w+',
+                                       dtype=np.float64, shape=data.shape)
+    for start in range(0, data.shape[0], block_rows):
+        rows = slice(start, start+block_rows)
+        a = np.asarray(data[rows], dtype=np.float64)
+        scores = score_block(a, target_obs, colex_obs[rows], 
+                             total_obs, logtransform, report)
+        with report.phase('packaging'):
+            result[rows] = scores
+        report.advance(a.size)
+    with report.phase('packaging'):
+        result.flush()
+    report.finish()
+    return result
@@ -0,0 +1,89 @@
+'''
+The Windows class extracts context windows around
+many nodes at once, as padded 2-D arrays of node ids
+or feature-value codes with a boundary mask.
+It replaces per-word loops over Positions.get.
+Feature values are read from FeatureColumns.
+'''
+
+import numpy as np
+from positions import PositionIndex
+from cooccurrence import CooccurrenceCounter
+from shared import load_tools
+
+FeatureColumns = load_tools('features').FeatureColumns
+
+def window_offsets(window):
+    '''
+    Return the offsets -window..-1, 1..window.
+    '''
+    return list(range(-window, 0)) + list(range(1, window+1))
+
+class Windows:
+    '''
+    Context windows for a set of nodes within a context otype.
+    nodes is a (centers * offsets) array of node ids, 0 where
+    the window reaches beyond the context; mask is True
+    where a window position holds a node.
+    '''
+
+    def __init__(self, tf, centers, context, offsets, otype='word', index=None,
+                 columns=None):
+        self.index = (index if index is not None
+                          else PositionIndex.cached(tf, context, otype))
+        self.api = self.index.api
+        self.columns = (columns if columns is not None
+                            else FeatureColumns.cached(tf))
+        self.centers = np.fromiter(centers, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.positions, self.mask = self.index.window(self.centers, self.offsets)
+        self.nodes = np.where(self.mask, self.index.nodes[self.positions], 0)
+        self._codes = {}
+
+    def codes(self, feature):
+        '''
+        Return a feature's values in the windows as
+        a 2-D array of integer codes, -1 where masked,
+        together with the list of values (code -> value).
+        String features keep their column's codes,
+        integer features are encoded by sorted value.
+        '''
+        if feature not in self._codes:
+            column = self.columns.Fs(feature)
+            keep = self.mask & column.has(self.nodes)
+            codes = np.full(self.nodes.shape, -1, dtype=np.int64)
+            if column.is_int:
+                values, codes[keep] = np.unique(column.codes(self.nodes[keep]),
+                                                return_inverse=True)
+                values = values.tolist()
+            else:
+                codes[keep] = column.codes(self.nodes[keep])
+                values = column.values
+            self._codes[feature] = (codes, values)
+        return self._codes[feature]
+
+    def counter(self, feature, target_feature=None, counter=None):
+        '''
+        Count target * colexeme co-occurrences of all windows.
+        Targets are the centers' target_feature values (default:
+        feature), colexemes are labeled '{offset}.{value}' as in
+        the get_window function of experiment.ipynb.
+        Empty values are skipped. Counts are added to counter,
+        a CooccurrenceCounter, or a new one.
+        '''
+        counter = CooccurrenceCounter() if counter is None else counter
+        target_feature = target_feature or feature
+        targets = self.columns.Fs(target_feature).v(self.centers)
+        target_ids = counter.targets.to_ids(targets.tolist())
+        codes, values = self.codes(feature)
+
+        # distinct (offset, value) pairs become colexeme labels
+        nvalues = max(len(values), 1)
+        keep = self.mask & np.isin(codes, [i for i, v in enumerate(values) if v])
+        rows, cols = np.nonzero(keep)
+        pairs = cols * nvalues + codes[rows, cols]
+        pairs, inverse = np.unique(pairs, return_inverse=True)
+        colex_ids = counter.colexes.to_ids(f'{self.offsets[p // nvalues]}.{values[p % nvalues]}'
+                                               for p in pairs)
+        counter.add_ids(target_ids[rows], colex_ids[inverse])
+        return counter